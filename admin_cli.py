@@ -15,7 +15,7 @@ from models import db, Subscriber, ScheduledMessage, Subscription, DepositApprov
 from plan_manager import get_active_plans, get_plan_by_id, validate_discount_code, apply_discount_code, increment_discount_code_usage
 from sms_sender import send_sms_to_subscriber
 from crypto_manager import activate_crypto_subscription
-from telegram_bot import send_telegram_notification
+from telegram_bot import send_telegram_notification, format_timezone_display
 from delivery_messages import get_delivery_message
 
 # Initialize Flask app for database access
@@ -42,19 +42,6 @@ def format_status(status):
     }
     return status_map.get(status, status.capitalize() if status else 'Unknown')
 
-def format_timezone_display(label, offset_minutes):
-    """Return human-friendly timezone text."""
-    if offset_minutes is None:
-        offset_minutes = 0
-    sign = '+' if offset_minutes >= 0 else '-'
-    minutes_abs = abs(offset_minutes)
-    hours = minutes_abs // 60
-    mins = minutes_abs % 60
-    offset_text = f"UTC{sign}{hours:02d}:{mins:02d}"
-    if label and label != 'UTC':
-        return f"{label} ({offset_text})"
-    return offset_text
-
 def list_subscribers(args):
     """List all subscribers."""
     with app.app_context():
@@ -1,15 +1,19 @@
 """
 Admin routes for web-based admin panel
 """
-from flask import Blueprint, render_template_string, request, jsonify, redirect, url_for
+from flask import Blueprint, render_template_string, request, jsonify, redirect, url_for, make_response
+import hashlib
+import math
 import os
+from sqlalchemy import and_, cast, delete, exists, Float, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 from models import db, Subscriber, ScheduledMessage, Subscription, DepositApproval, SubscriptionPlan, DiscountCode, ServiceGroup
-from plan_manager import get_active_plans, get_plan_by_id, validate_discount_code, apply_discount_code, increment_discount_code_usage
+from plan_manager import get_active_plans, get_plan_by_id, validate_discount_code, apply_discount_code, increment_discount_code_usage, get_cached_code_validation, cache_code_validation, clear_code_validation_cache
 from sms_sender import send_sms_to_subscriber
 from crypto_manager import activate_crypto_subscription
-from telegram_bot import send_telegram_notification
+from telegram_bot import send_telegram_notification, format_timezone_display
 from delivery_messages import get_delivery_message, create_delivery_message
 from datetime import datetime, timedelta, timezone
 
@@ -1082,12 +1086,23 @@ ADMIN_TEMPLATE = """
 
         // ========== Discount Code Management Functions ==========
         
-        async function loadCodes() {
+        let loadedCodes = [];
+        let nextCodesCursor = null;
+        
+        async function loadCodes(more = false) {
             try {
-                const response = await fetch('/admin/api/codes');
+                let url = '/admin/api/codes';
+                if (more && nextCodesCursor) {
+                    url += `?cursor=${encodeURIComponent(nextCodesCursor.cursor)}&cursor_id=${nextCodesCursor.id}`;
+                }
+                const response = await fetch(url);
                 const data = await response.json();
                 
-                if (!data.codes || data.codes.length === 0) {
+                if (!more) loadedCodes = [];
+                loadedCodes = loadedCodes.concat(data.codes || []);
+                nextCodesCursor = data.next_cursor ? { cursor: data.next_cursor, id: data.next_cursor_id } : null;
+                
+                if (loadedCodes.length === 0) {
                     document.getElementById('codes-container').innerHTML = '<p>No discount codes found. Generate your first code!</p>';
                     return;
                 }
@@ -1110,7 +1125,7 @@ ADMIN_TEMPLATE = """
                         <tbody>
                 `;
                 
-                data.codes.forEach(code => {
+                loadedCodes.forEach(code => {
                     const discountDisplay = code.discount_type === 'percent' 
                         ? `${code.discount_value}%` 
                         : `$${code.discount_value.toFixed(2)}`;
@@ -1145,6 +1160,9 @@ ADMIN_TEMPLATE = """
                 });
                 
                 tableHtml += '</tbody></table>';
+                if (nextCodesCursor) {
+                    tableHtml += '<button class="btn btn-primary" onclick="loadCodes(true)">Load more</button>';
+                }
                 document.getElementById('codes-container').innerHTML = tableHtml;
             } catch (error) {
                 console.error('Error loading codes:', error);
@@ -1159,24 +1177,21 @@ ADMIN_TEMPLATE = """
             
             if (codeId) {
                 title.textContent = 'Edit Discount Code';
-                fetch(`/admin/api/codes`)
-                    .then(r => r.json())
-                    .then(data => {
-                        const code = data.codes.find(c => c.id === codeId);
-                        if (code) {
-                            document.getElementById('code-id').value = code.id;
-                            document.getElementById('code-code').value = code.code;
-                            document.getElementById('code-description').value = code.description || '';
-                            document.getElementById('code-discount-type').value = code.discount_type;
-                            document.getElementById('code-discount-value').value = code.discount_value;
-                            document.getElementById('code-max-uses').value = code.max_uses || '';
-                            document.getElementById('code-valid-from').value = code.valid_from ? code.valid_from.substring(0, 16) : '';
-                            document.getElementById('code-valid-until').value = code.valid_until ? code.valid_until.substring(0, 16) : '';
-                            document.getElementById('code-plan-ids').value = code.applicable_plan_ids || '';
-                            document.getElementById('code-is-active').checked = code.is_active;
-                            updateDiscountType();
-                        }
-                    });
+                // Codes are already loaded page by page in the table
+                const code = loadedCodes.find(c => c.id === codeId);
+                if (code) {
+                    document.getElementById('code-id').value = code.id;
+                    document.getElementById('code-code').value = code.code;
+                    document.getElementById('code-description').value = code.description || '';
+                    document.getElementById('code-discount-type').value = code.discount_type;
+                    document.getElementById('code-discount-value').value = code.discount_value;
+                    document.getElementById('code-max-uses').value = code.max_uses || '';
+                    document.getElementById('code-valid-from').value = code.valid_from ? code.valid_from.substring(0, 16) : '';
+                    document.getElementById('code-valid-until').value = code.valid_until ? code.valid_until.substring(0, 16) : '';
+                    document.getElementById('code-plan-ids').value = code.applicable_plan_ids || '';
+                    document.getElementById('code-is-active').checked = code.is_active;
+                    updateDiscountType();
+                }
             } else {
                 title.textContent = 'Generate Discount Code';
                 form.reset();
@@ -1376,6 +1391,104 @@ ADMIN_TEMPLATE = """
 </html>
 """
 
+def _parse_iso(value):
+    """Parse an ISO 8601 timestamp (accepting a trailing 'Z'), or None if empty."""
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise TypeError('expected an ISO 8601 string')
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _naive_utc(value):
+    """Convert an aware datetime to naive UTC (naive values are taken as UTC already)."""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _required_str(value):
+    """Accept a non-empty string."""
+    if not isinstance(value, str) or not value:
+        raise ValueError('expected a non-empty string')
+    return value
+
+def _optional_str(value):
+    """Accept a string or None."""
+    if value is not None and not isinstance(value, str):
+        raise TypeError('expected a string')
+    return value
+
+def _finite_float(value):
+    """Accept a finite number (or numeric string); rejects booleans, 'inf' and 'nan'."""
+    if isinstance(value, bool):
+        raise TypeError('expected a number')
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError('expected a finite number')
+    return number
+
+def _as_int(value):
+    """Accept an integral number (or integer string); rejects booleans and fractional values like 3.7."""
+    if isinstance(value, bool):
+        raise TypeError('expected an integer')
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError('expected an integer')
+        return int(value)
+    return int(value)
+
+def _optional_int(value):
+    """Accept an integer (or integer string) or None."""
+    return None if value is None else _as_int(value)
+
+def _as_bool(value):
+    """Accept a JSON boolean (or 0/1)."""
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    raise ValueError('expected a boolean')
+
+def _coerce_fields(data, converters):
+    """
+    Validate and convert request fields in a single pass.
+    
+    Args:
+        data: Request JSON dict
+        converters: Dict of field -> (converter, error message); fields missing from data are skipped
+    
+    Returns:
+        tuple: (converted values dict, error message or None)
+    """
+    values = {}
+    for field, (converter, error) in converters.items():
+        if field in data:
+            try:
+                values[field] = converter(data[field])
+            except (TypeError, ValueError):
+                return None, error
+    return values, None
+
+def _table_etag(model):
+    """
+    Build an ETag for a list endpoint from the table's row count and latest updated_at.
+    
+    Args:
+        model: Model class with id and updated_at columns
+    
+    Returns:
+        str: ETag value (also varies with the request's query string)
+    """
+    count, latest = db.session.query(func.count(model.id), func.max(model.updated_at)).one()
+    key = f"{count}:{latest}:{request.query_string.decode()}"
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+def _with_etag(response, etag):
+    """Attach the ETag and make browsers revalidate before reusing the response."""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @admin_bp.route('/')
 def admin_panel():
     """Admin panel main page."""
@@ -1681,18 +1794,11 @@ def admin_schedule_message():
     
     try:
         # Parse datetime from ISO format
-        parsed_time = datetime.fromisoformat(scheduled_time_str.replace('Z', '+00:00'))
+        parsed_time = _parse_iso(scheduled_time_str)
 
         timezone_offset = subscriber.timezone_offset_minutes or 0
         timezone_label = subscriber.timezone_label or 'UTC'
 
-        def format_offset(minutes: int) -> str:
-            sign = '+' if minutes >= 0 else '-'
-            minutes_abs = abs(minutes)
-            hours = minutes_abs // 60
-            mins = minutes_abs % 60
-            return f"UTC{sign}{hours:02d}:{mins:02d}"
-
         # Check if subscriber wants timezone matching
         use_timezone_matching = subscriber.use_timezone_matching and subscriber.message_delivery_preference == 'scheduled_timezone'
         
@@ -1722,9 +1828,7 @@ def admin_schedule_message():
         db.session.add(scheduled_msg)
         db.session.commit()
         
-        timezone_display = format_offset(timezone_offset)
-        if timezone_label and timezone_label != 'UTC':
-            timezone_display = f"{timezone_label} ({timezone_display})"
+        timezone_display = format_timezone_display(timezone_label, timezone_offset)
         
         matching_status = "with timezone matching" if use_timezone_matching else "without timezone matching"
         
@@ -1733,7 +1837,7 @@ def admin_schedule_message():
             'scheduled_message_id': scheduled_msg.id,
             'timezone_matched': use_timezone_matching
         })
-    except ValueError as e:
+    except (TypeError, ValueError) as e:
         return jsonify({'error': f'Invalid date format: {str(e)}'}), 400
     except Exception as e:
         db.session.rollback()
@@ -1744,9 +1848,12 @@ def get_deposits():
     """Get all deposit approvals and pending crypto subscribers."""
     result = []
     
-    # Get all DepositApproval records
-    deposits = DepositApproval.query.order_by(DepositApproval.created_at.desc()).all()
-    for deposit in deposits:
+    # Get all DepositApproval records (amount cast to float in SQL so it serializes natively)
+    deposits = db.session.query(
+        DepositApproval,
+        cast(DepositApproval.amount, Float)
+    ).order_by(DepositApproval.created_at.desc()).all()
+    for deposit, amount in deposits:
         subscriber = deposit.subscriber
         result.append({
             'id': deposit.id,
@@ -1755,7 +1862,7 @@ def get_deposits():
             'subscriber_name': subscriber.name if subscriber else None,
             'subscriber_phone': subscriber.phone_number if subscriber else None,
             'currency': deposit.currency,
-            'amount': float(deposit.amount) if deposit.amount else 0,
+            'amount': amount or 0,
             'wallet_address': deposit.wallet_address,
             'transaction_hash': deposit.transaction_hash,
             'status': deposit.status,
@@ -1772,7 +1879,7 @@ def get_deposits():
     
     for subscriber in pending_crypto_subscribers:
         # Check if this subscriber already has a DepositApproval record
-        has_deposit_approval = any(d.subscriber_id == subscriber.id for d in deposits)
+        has_deposit_approval = any(d.subscriber_id == subscriber.id for d, _ in deposits)
         if not has_deposit_approval:
             # This is a pending crypto subscriber without DepositApproval (likely Coinbase Commerce)
             result.append({
@@ -2026,14 +2133,29 @@ def reject_subscriber_payment(subscriber_id):
 
 # ========== Plan Management API Endpoints ==========
 
+# Accepted plan fields and their converters (also the PUT /api/plans/<id> whitelist)
+PLAN_FIELDS = {
+    'name': (_required_str, 'Name must be a non-empty string'),
+    'description': (_optional_str, 'Description must be a string'),
+    'price': (_finite_float, 'Price must be a number'),
+    'currency': (_required_str, 'Currency must be a non-empty string'),
+    'trial_days': (_as_int, 'Trial days must be an integer'),
+    'is_active': (_as_bool, 'is_active must be a boolean'),
+    'display_order': (_as_int, 'Display order must be an integer'),
+}
+
 @admin_bp.route('/api/plans', methods=['GET'])
 def get_plans():
     """Get all subscription plans."""
     try:
+        etag = _table_etag(SubscriptionPlan)
+        if etag in request.if_none_match:
+            return _with_etag(make_response('', 304), etag)
+        
         plans = SubscriptionPlan.query.order_by(SubscriptionPlan.display_order).all()
-        return jsonify({
+        return _with_etag(jsonify({
             'plans': [plan.to_dict() for plan in plans]
-        })
+        }), etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2045,36 +2167,28 @@ def create_plan():
         
         # Validate required fields
         name = data.get('name')
-        price = data.get('price')
         if not name:
             return jsonify({'error': 'Name is required'}), 400
-        if price is None:
+        if data.get('price') is None:
             # allow zero price (free/trial plans) so only None is treated as missing
             return jsonify({'error': 'Price is required'}), 400
-        # Ensure price is numeric
-        try:
-            price = float(price)
-        except (TypeError, ValueError):
-            return jsonify({'error': 'Price must be a number'}), 400
-        
-        # Check if plan name already exists
-        existing = SubscriptionPlan.query.filter_by(name=data['name']).first()
-        if existing:
-            return jsonify({'error': f"Plan with name '{data['name']}' already exists"}), 400
-        
-        plan = SubscriptionPlan(
-            name=name,
-            description=data.get('description'),
-            price=price,
-            currency=data.get('currency', 'USD'),
-            has_trial=data.get('trial_days', 0) > 0,
-            trial_days=data.get('trial_days', 0),
-            is_active=data.get('is_active', True),
-            display_order=data.get('display_order', 0)
-        )
+        
+        values, error = _coerce_fields(data, PLAN_FIELDS)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        # Omitted fields fall back to the column defaults
+        plan = SubscriptionPlan(has_trial=values.get('trial_days', 0) > 0, **values)
         
         db.session.add(plan)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # Work out which constraint failed (error path only)
+            if db.session.query(exists().where(SubscriptionPlan.name == values['name'])).scalar():
+                return jsonify({'error': f"Plan with name '{values['name']}' already exists"}), 400
+            return jsonify({'error': 'Plan violates a database constraint'}), 400
         
         return jsonify({
             'message': 'Plan created successfully',
@@ -2088,43 +2202,44 @@ def create_plan():
 def update_plan(plan_id):
     """Update a subscription plan."""
     try:
-        plan = SubscriptionPlan.query.get(plan_id)
-        if not plan:
-            return jsonify({'error': 'Plan not found'}), 404
-        
         data = request.get_json()
         
-        if 'name' in data:
-            # Check if new name conflicts with another plan
-            existing = SubscriptionPlan.query.filter_by(name=data['name']).first()
-            if existing and existing.id != plan.id:
-                return jsonify({'error': f"Plan with name '{data['name']}' already exists"}), 400
-            plan.name = data['name']
-        
-        if 'description' in data:
-            plan.description = data['description']
-        
-        if 'price' in data:
-            plan.price = data['price']
-        
-        if 'currency' in data:
-            plan.currency = data['currency']
-        
-        if 'trial_days' in data:
-            plan.has_trial = data['trial_days'] > 0
-            plan.trial_days = data['trial_days']
+        changes, error = _coerce_fields(data, PLAN_FIELDS)
+        if error:
+            return jsonify({'error': error}), 400
+        if 'trial_days' in changes:
+            changes['has_trial'] = changes['trial_days'] > 0
         
-        if 'is_active' in data:
-            plan.is_active = data['is_active']
-        
-        if 'display_order' in data:
-            plan.display_order = data['display_order']
-        
-        db.session.commit()
+        try:
+            # One transaction for the whole update; the context manager commits or rolls back
+            with db.session.begin(), db.session.no_autoflush:
+                if changes:
+                    # Single UPDATE ... RETURNING; the unique constraint on name reports conflicts
+                    plan = db.session.execute(
+                        update(SubscriptionPlan)
+                        .where(SubscriptionPlan.id == plan_id)
+                        .values(**changes)
+                        .returning(SubscriptionPlan)
+                    ).scalar_one_or_none()
+                else:
+                    plan = db.session.get(SubscriptionPlan, plan_id)
+                if not plan:
+                    return jsonify({'error': 'Plan not found'}), 404
+                
+                # Serialize before commit so the expired instance isn't reloaded
+                plan_dict = plan.to_dict()
+        except IntegrityError:
+            # Only a submitted name can conflict with another plan; report anything else generically
+            name = changes.get('name')
+            if name and db.session.query(
+                exists().where(SubscriptionPlan.name == name, SubscriptionPlan.id != plan_id)
+            ).scalar():
+                return jsonify({'error': f"Plan with name '{name}' already exists"}), 400
+            return jsonify({'error': 'Plan violates a database constraint'}), 400
         
         return jsonify({
             'message': 'Plan updated successfully',
-            'plan': plan.to_dict()
+            'plan': plan_dict
         })
     except Exception as e:
         db.session.rollback()
@@ -2134,20 +2249,37 @@ def update_plan(plan_id):
 def delete_plan(plan_id):
     """Delete a subscription plan."""
     try:
-        plan = SubscriptionPlan.query.get(plan_id)
-        if not plan:
-            return jsonify({'error': 'Plan not found'}), 404
+        # Detach service groups that default to this plan (what the ORM cascade did)
+        db.session.execute(
+            update(ServiceGroup).where(ServiceGroup.default_plan_id == plan_id).values(default_plan_id=None),
+            execution_options={'synchronize_session': False}
+        )
         
-        # Check if plan is being used
-        subscribers_count = Subscriber.query.filter_by(plan_id=plan_id).count()
-        if subscribers_count > 0:
+        # Delete only if no subscriber uses the plan, in a single statement
+        plan_name = db.session.execute(
+            delete(SubscriptionPlan)
+            .where(SubscriptionPlan.id == plan_id)
+            .where(~exists().where(Subscriber.plan_id == plan_id))
+            .returning(SubscriptionPlan.name)
+        ).scalar_one_or_none()
+        
+        if plan_name is None:
+            db.session.rollback()
+            # Nothing deleted - work out why (error path only)
+            if db.session.get(SubscriptionPlan, plan_id) is None:
+                return jsonify({'error': 'Plan not found'}), 404
             return jsonify({
-                'error': f"Cannot delete plan - it is being used by {subscribers_count} subscriber(s)"
+                'error': 'Cannot delete plan - it is being used by subscribers'
             }), 400
         
-        plan_name = plan.name
-        db.session.delete(plan)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # ON DELETE RESTRICT caught a subscriber assigned after the check above
+            db.session.rollback()
+            return jsonify({
+                'error': 'Cannot delete plan - it is being used by subscribers'
+            }), 400
         
         return jsonify({
             'message': f'Plan "{plan_name}" deleted successfully'
@@ -2158,14 +2290,89 @@ def delete_plan(plan_id):
 
 # ========== Discount Code Management API Endpoints ==========
 
+# Validator ordering: create_code/update_code run every in-memory check (required
+# fields, discount type, value range, date order) before touching the database,
+# so malformed requests are rejected without a single query.
+
+DISCOUNT_TYPES = ('percent', 'fixed')
+
+# Keyset page sizes for GET /api/codes
+CODES_PAGE_SIZE = 50
+CODES_PAGE_MAX = 200
+
+# Accepted discount code fields and their converters (plan_ids is mapped separately)
+CODE_FIELDS = {
+    'code': (lambda value: _required_str(value).upper(), 'Code must be a non-empty string'),
+    'description': (_optional_str, 'Description must be a string'),
+    'discount_type': (_required_str, "discount_type must be 'percent' or 'fixed'"),
+    'discount_value': (_finite_float, 'discount_value must be a number'),
+    'max_uses': (_optional_int, 'max_uses must be an integer'),
+    'valid_from': (_parse_iso, 'valid_from must be an ISO 8601 date'),
+    'valid_until': (_parse_iso, 'valid_until must be an ISO 8601 date'),
+    'is_active': (_as_bool, 'is_active must be a boolean'),
+}
+
 @admin_bp.route('/api/codes', methods=['GET'])
 def get_codes():
-    """Get all discount codes."""
+    """
+    Get discount codes, newest first, one keyset page at a time.
+    
+    Query params:
+        cursor: created_at of the last code on the previous page (ISO 8601)
+        cursor_id: id of that code, breaks ties between equal timestamps
+        limit: page size (default 50, max CODES_PAGE_MAX)
+    """
     try:
-        codes = DiscountCode.query.order_by(DiscountCode.created_at.desc()).all()
-        return jsonify({
-            'codes': [code.to_dict() for code in codes]
-        })
+        limit = request.args.get('limit', CODES_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, CODES_PAGE_MAX))
+        try:
+            cursor = _parse_iso(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor format'}), 400
+        cursor_id = request.args.get('cursor_id', type=int)
+        
+        # Unchanged table and page: let the client reuse its copy
+        etag = _table_etag(DiscountCode)
+        if etag in request.if_none_match:
+            return _with_etag(make_response('', 304), etag)
+        
+        # Read the stored to_dict() payloads directly, no ORM hydration
+        query = select(DiscountCode.id, DiscountCode.created_at, DiscountCode.cached_repr)
+        if cursor is not None:
+            cursor = _naive_utc(cursor)
+            if cursor_id is not None:
+                query = query.where(or_(
+                    DiscountCode.created_at < cursor,
+                    and_(DiscountCode.created_at == cursor, DiscountCode.id < cursor_id)
+                ))
+            else:
+                query = query.where(DiscountCode.created_at < cursor)
+        rows = db.session.execute(
+            query.order_by(DiscountCode.created_at.desc(), DiscountCode.id.desc()).limit(limit + 1)
+        ).all()
+        
+        # The extra row only signals that another page exists
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        missing = [code_id for code_id, _, cached in rows if cached is None]
+        if missing:
+            # Rows written before cached_repr existed
+            fallback = {code.id: code.to_dict() for code in DiscountCode.query.filter(DiscountCode.id.in_(missing))}
+            codes = [cached if cached is not None else fallback[code_id] for code_id, _, cached in rows]
+        else:
+            codes = [cached for _, _, cached in rows]
+        
+        next_cursor = next_cursor_id = None
+        if has_more and rows[-1].created_at is not None:
+            next_cursor = rows[-1].created_at.isoformat()
+            next_cursor_id = rows[-1].id
+        
+        return _with_etag(jsonify({
+            'codes': codes,
+            'next_cursor': next_cursor,
+            'next_cursor_id': next_cursor_id
+        }), etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -2179,40 +2386,42 @@ def create_code():
         if not data.get('code') or not data.get('discount_type') or data.get('discount_value') is None:
             return jsonify({'error': 'Code, discount_type, and discount_value are required'}), 400
         
-        # Check if code already exists
-        existing = DiscountCode.query.filter_by(code=data['code'].upper()).first()
-        if existing:
-            return jsonify({'error': f"Discount code '{data['code'].upper()}' already exists"}), 400
+        values, error = _coerce_fields(data, CODE_FIELDS)
+        if error:
+            return jsonify({'error': error}), 400
+        code_text = values['code']
+        discount_type = values['discount_type']
+        discount_value = values['discount_value']
+        
+        if discount_type not in DISCOUNT_TYPES:
+            return jsonify({'error': "discount_type must be 'percent' or 'fixed'"}), 400
         
         # Validate discount value
-        if data['discount_type'] == 'percent' and (data['discount_value'] < 0 or data['discount_value'] > 100):
+        if discount_type == 'percent' and (discount_value < 0 or discount_value > 100):
             return jsonify({'error': 'Percentage discount must be between 0 and 100'}), 400
         
-        if data['discount_type'] == 'fixed' and data['discount_value'] < 0:
+        if discount_type == 'fixed' and discount_value < 0:
             return jsonify({'error': 'Fixed discount cannot be negative'}), 400
         
-        # Parse validity dates
-        valid_from = None
-        valid_until = None
-        if data.get('valid_from'):
-            valid_from = datetime.fromisoformat(data['valid_from'].replace('Z', '+00:00'))
-        if data.get('valid_until'):
-            valid_until = datetime.fromisoformat(data['valid_until'].replace('Z', '+00:00'))
-        
-        code = DiscountCode(
-            code=data['code'].upper(),
-            description=data.get('description'),
-            discount_type=data['discount_type'],
-            discount_value=data['discount_value'],
-            max_uses=data.get('max_uses'),
-            valid_from=valid_from,
-            valid_until=valid_until,
-            is_active=data.get('is_active', True),
-            applicable_plan_ids=data.get('plan_ids')
-        )
+        # Check validity dates
+        valid_from = values.get('valid_from')
+        valid_until = values.get('valid_until')
+        if valid_from and valid_until and _naive_utc(valid_from) >= _naive_utc(valid_until):
+            return jsonify({'error': 'valid_from must be before valid_until'}), 400
+        
+        # Omitted fields fall back to the column defaults
+        code = DiscountCode(applicable_plan_ids=data.get('plan_ids'), **values)
         
         db.session.add(code)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            # Work out which constraint failed (error path only)
+            if db.session.query(exists().where(DiscountCode.code == code_text)).scalar():
+                return jsonify({'error': f"Discount code '{code_text}' already exists"}), 400
+            return jsonify({'error': 'Discount code violates a database constraint'}), 400
+        clear_code_validation_cache()
         
         return jsonify({
             'message': 'Discount code created successfully',
@@ -2226,54 +2435,71 @@ def create_code():
 def update_code(code_id):
     """Update a discount code."""
     try:
-        code = DiscountCode.query.get(code_id)
-        if not code:
-            return jsonify({'error': 'Discount code not found'}), 404
-        
         data = request.get_json()
         
-        if 'code' in data:
-            # Check if new code conflicts with another code
-            existing = DiscountCode.query.filter_by(code=data['code'].upper()).first()
-            if existing and existing.id != code.id:
-                return jsonify({'error': f"Discount code '{data['code'].upper()}' already exists"}), 400
-            code.code = data['code'].upper()
-        
-        if 'description' in data:
-            code.description = data['description']
-        
-        if 'discount_type' in data:
-            code.discount_type = data['discount_type']
-        
-        if 'discount_value' in data:
-            # Validate discount value
-            discount_type = data.get('discount_type', code.discount_type)
-            if discount_type == 'percent' and (data['discount_value'] < 0 or data['discount_value'] > 100):
-                return jsonify({'error': 'Percentage discount must be between 0 and 100'}), 400
-            if discount_type == 'fixed' and data['discount_value'] < 0:
-                return jsonify({'error': 'Fixed discount cannot be negative'}), 400
-            code.discount_value = data['discount_value']
+        changes, error = _coerce_fields(data, CODE_FIELDS)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if 'max_uses' in data:
-            code.max_uses = data['max_uses']
-        
-        if 'valid_from' in data:
-            code.valid_from = datetime.fromisoformat(data['valid_from'].replace('Z', '+00:00')) if data['valid_from'] else None
-        
-        if 'valid_until' in data:
-            code.valid_until = datetime.fromisoformat(data['valid_until'].replace('Z', '+00:00')) if data['valid_until'] else None
-        
-        if 'is_active' in data:
-            code.is_active = data['is_active']
-        
-        if 'plan_ids' in data:
-            code.applicable_plan_ids = data['plan_ids'] if data['plan_ids'] else None
-        
-        db.session.commit()
+        try:
+            # One transaction for the lookup and update; the context manager commits or rolls back
+            with db.session.begin(), db.session.no_autoflush:
+                if 'discount_type' in changes and changes['discount_type'] not in DISCOUNT_TYPES:
+                    return jsonify({'error': "discount_type must be 'percent' or 'fixed'"}), 400
+                
+                if 'discount_value' in changes:
+                    # Validate discount value (the stored type is only needed when the value is out of range)
+                    discount_value = changes['discount_value']
+                    if 'discount_type' in changes:
+                        discount_type = changes['discount_type']
+                    elif discount_value < 0 or discount_value > 100:
+                        discount_type = db.session.query(DiscountCode.discount_type).filter_by(id=code_id).scalar()
+                    else:
+                        discount_type = None
+                    if discount_type == 'percent' and (discount_value < 0 or discount_value > 100):
+                        return jsonify({'error': 'Percentage discount must be between 0 and 100'}), 400
+                    if discount_type == 'fixed' and discount_value < 0:
+                        return jsonify({'error': 'Fixed discount cannot be negative'}), 400
+                
+                valid_from = changes.get('valid_from')
+                valid_until = changes.get('valid_until')
+                if valid_from and valid_until and _naive_utc(valid_from) >= _naive_utc(valid_until):
+                    return jsonify({'error': 'valid_from must be before valid_until'}), 400
+                
+                if 'plan_ids' in data:
+                    changes['applicable_plan_ids'] = data['plan_ids'] if data['plan_ids'] else None
+                
+                if changes:
+                    # Single UPDATE ... RETURNING; the unique constraint on code reports conflicts
+                    code = db.session.execute(
+                        update(DiscountCode)
+                        .where(DiscountCode.id == code_id)
+                        .values(**changes)
+                        .returning(DiscountCode)
+                    ).scalar_one_or_none()
+                else:
+                    code = db.session.get(DiscountCode, code_id)
+                if not code:
+                    return jsonify({'error': 'Discount code not found'}), 404
+                
+                if changes:
+                    # Bulk UPDATE skips the mapper events, so refresh cached_repr here
+                    db.session.execute(code.cached_repr_update())
+                # Serialize before commit so the expired instance isn't reloaded
+                code_dict = code.to_dict()
+        except IntegrityError:
+            # Only a submitted code can conflict with another code; report anything else generically
+            code_text = changes.get('code')
+            if code_text and db.session.query(
+                exists().where(DiscountCode.code == code_text, DiscountCode.id != code_id)
+            ).scalar():
+                return jsonify({'error': f"Discount code '{code_text}' already exists"}), 400
+            return jsonify({'error': 'Discount code violates a database constraint'}), 400
+        clear_code_validation_cache()
         
         return jsonify({
             'message': 'Discount code updated successfully',
-            'code': code.to_dict()
+            'code': code_dict
         })
     except Exception as e:
         db.session.rollback()
@@ -2283,13 +2509,21 @@ def update_code(code_id):
 def delete_code(code_id):
     """Delete a discount code."""
     try:
-        code = DiscountCode.query.get(code_id)
-        if not code:
+        # Detach subscribers that redeemed this code (what the ORM cascade did)
+        db.session.execute(
+            update(Subscriber).where(Subscriber.discount_code_id == code_id).values(discount_code_id=None),
+            execution_options={'synchronize_session': False}
+        )
+        
+        code_name = db.session.execute(
+            delete(DiscountCode).where(DiscountCode.id == code_id).returning(DiscountCode.code)
+        ).scalar_one_or_none()
+        if code_name is None:
+            db.session.rollback()
             return jsonify({'error': 'Discount code not found'}), 404
         
-        code_name = code.code
-        db.session.delete(code)
         db.session.commit()
+        clear_code_validation_cache()
         
         return jsonify({
             'message': f'Discount code "{code_name}" deleted successfully'
@@ -2309,18 +2543,16 @@ def validate_code():
         if not code_text:
             return jsonify({'error': 'Code is required'}), 400
         
-        is_valid, discount_code, error_msg = validate_discount_code(code_text, plan_id)
-        
-        if not is_valid:
-            return jsonify({
-                'valid': False,
-                'error': error_msg
-            }), 200
+        result = get_cached_code_validation(code_text, plan_id)
+        if result is None:
+            is_valid, discount_code, error_msg = validate_discount_code(code_text, plan_id)
+            if is_valid:
+                result = {'valid': True, 'code': discount_code.to_dict()}
+            else:
+                result = {'valid': False, 'error': error_msg}
+            cache_code_validation(code_text, plan_id, result)
         
-        return jsonify({
-            'valid': True,
-            'code': discount_code.to_dict()
-        })
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1,22 +1,43 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
 from config import Config
-from models import db, Subscriber, ScheduledMessage, DepositApproval
-from email_sms_gateways import get_sms_email, list_available_carriers
-from subscription_manager import create_subscription as create_stripe_subscription, cancel_subscription as cancel_stripe_subscription, handle_stripe_webhook
-from paypal_manager import create_paypal_subscription, execute_paypal_agreement, cancel_paypal_subscription, handle_paypal_webhook
+from models import db, Subscriber, ScheduledMessage, DepositApproval, Subscription
+from sqlalchemy import delete, exists, or_
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from email_sms_gateways import get_sms_email, list_available_carriers, EMAIL_SMS_GATEWAYS
+from subscription_manager import create_subscription as create_stripe_subscription, cancel_subscription as cancel_stripe_subscription, handle_stripe_webhook, create_stripe_customer, cancel_stripe_subscription_id
+from paypal_manager import create_paypal_subscription, execute_paypal_agreement, cancel_paypal_subscription, cancel_paypal_agreement, handle_paypal_webhook
 from crypto_manager import create_crypto_checkout, create_manual_crypto_subscription, verify_manual_crypto_payment, handle_coinbase_webhook, get_crypto_wallet_addresses, get_available_crypto_currencies
 from sms_sender import send_sms_to_subscriber
 from scheduler import schedule_message, start_scheduler
-from telegram_bot import setup_telegram_bot, send_telegram_notification
+from telegram_bot import setup_telegram_bot, send_telegram_notification, format_timezone_display
+from telegram.error import Conflict
 from admin_routes import admin_bp
+from json_provider import init_json_provider, dumps as json_dumps
 import stripe
+import requests
 from datetime import datetime, timedelta, timezone
+import asyncio
+import hmac
+import logging
+import tempfile
 import threading
+import time
 import os
 
+try:
+    from waitress import serve
+except ImportError:  # waitress is optional, fall back to Flask's built-in server
+    serve = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process bot lock applies
+    fcntl = None
+
 app = Flask(__name__)
 app.config.from_object(Config)
+init_json_provider(app)
 CORS(app)
 
 # Register admin blueprint
@@ -31,45 +52,79 @@ stripe.api_key = Config.STRIPE_SECRET_KEY
 with app.app_context():
     db.create_all()
 
+# Static response bodies, serialized once at import
+_INDEX_JSON = json_dumps({
+    'message': 'Subscription Service Bot API',
+    'version': '1.0',
+    'endpoints': {
+        'health': '/api/health',
+        'carriers': '/api/carriers',
+        'subscribe': '/api/subscribe (POST)',
+        'subscribers': '/api/subscribers (GET)',
+        'stripe_webhook': '/api/stripe-webhook (POST)',
+        'paypal_webhook': '/api/paypal-webhook (POST)',
+        'crypto_webhook': '/api/crypto-webhook (POST)',
+        'admin_panel': '/admin (Web-based admin interface)'
+    },
+    'telegram_bot': 'Available' if Config.TELEGRAM_BOT_TOKEN else 'Not configured',
+    'admin_panel': 'Available at /admin'
+})
+_API_INFO_JSON = json_dumps({
+    'message': 'Subscription Service Bot API',
+    'version': '1.0',
+    'documentation': 'See README.md for API documentation'
+})
+_CARRIERS_JSON = json_dumps({
+    'carriers': list_available_carriers(),
+    'gateways': {k: f"[10-digit-number]@{v}" for k, v in EMAIL_SMS_GATEWAYS.items()}
+})
+_CRYPTO_WALLETS_JSON = json_dumps({
+    'wallets': get_crypto_wallet_addresses(),
+    'monthly_price': Config.MONTHLY_PRICE
+})
+_HEALTH_JSON = json_dumps({'status': 'healthy'})
+_SUBSCRIBE_CANCEL_JSON = json_dumps({'message': 'Subscription payment canceled'})
+
+# Stripe Checkout parameters that only depend on configuration
+_STRIPE_LINE_ITEMS = [{
+    'price_data': {
+        'currency': 'usd',
+        'product_data': {'name': 'Monthly Subscription'},
+        'unit_amount': round(Config.MONTHLY_PRICE * 100),  # round, not int: int(19.99 * 100) == 1998
+        'recurring': {'interval': 'month'}
+    },
+    'quantity': 1,
+}]
+_STRIPE_SUCCESS_URL = f"{Config.BASE_URL}/api/subscribe/success?session_id={{CHECKOUT_SESSION_ID}}"
+_STRIPE_CANCEL_URL = f"{Config.BASE_URL}/api/subscribe/cancel"
+
+# Stripe webhook signing secret as bytes, encoded once instead of per request
+_STRIPE_WEBHOOK_KEY = Config.STRIPE_WEBHOOK_SECRET.encode('utf-8') if Config.STRIPE_WEBHOOK_SECRET else None
+
+def _static_json_response(body, cacheable=True):
+    """Wrap a pre-serialized JSON body that is fixed for the life of the process."""
+    response = app.response_class(body, mimetype='application/json')
+    if cacheable:
+        response.cache_control.public = True
+        response.cache_control.max_age = 3600
+    return response
+
 # API Routes
 
 @app.route('/', methods=['GET'])
 def index():
     """Root endpoint - API information."""
-    return jsonify({
-        'message': 'Subscription Service Bot API',
-        'version': '1.0',
-        'endpoints': {
-            'health': '/api/health',
-            'carriers': '/api/carriers',
-            'subscribe': '/api/subscribe (POST)',
-            'subscribers': '/api/subscribers (GET)',
-            'stripe_webhook': '/api/stripe-webhook (POST)',
-            'paypal_webhook': '/api/paypal-webhook (POST)',
-            'crypto_webhook': '/api/crypto-webhook (POST)',
-            'admin_panel': '/admin (Web-based admin interface)'
-        },
-        'telegram_bot': 'Available' if Config.TELEGRAM_BOT_TOKEN else 'Not configured',
-        'admin_panel': 'Available at /admin'
-    })
+    return _static_json_response(_INDEX_JSON)
 
 @app.route('/api', methods=['GET'])
 def api_info():
     """API information endpoint."""
-    return jsonify({
-        'message': 'Subscription Service Bot API',
-        'version': '1.0',
-        'documentation': 'See README.md for API documentation'
-    })
+    return _static_json_response(_API_INFO_JSON)
 
 @app.route('/api/carriers', methods=['GET'])
 def get_carriers():
     """Get list of available carriers."""
-    from email_sms_gateways import EMAIL_SMS_GATEWAYS
-    return jsonify({
-        'carriers': list_available_carriers(),
-        'gateways': {k: f"[10-digit-number]@{v}" for k, v in EMAIL_SMS_GATEWAYS.items()}
-    })
+    return _static_json_response(_CARRIERS_JSON)
 
 @app.route('/api/subscribe', methods=['POST'])
 def subscribe():
@@ -114,7 +169,6 @@ def subscribe():
             if payment_method == 'stripe':
                 # Create Stripe customer first (if not exists)
                 if not subscriber.stripe_customer_id:
-                    from subscription_manager import create_stripe_customer
                     create_stripe_customer(subscriber)
                 
                 # Create Stripe Checkout session for payment collection
@@ -124,18 +178,10 @@ def subscribe():
                     checkout_session = stripe.checkout.Session.create(
                         customer=subscriber.stripe_customer_id,
                         payment_method_types=['card'],
-                        line_items=[{
-                            'price_data': {
-                                'currency': 'usd',
-                                'product_data': {'name': 'Monthly Subscription'},
-                                'unit_amount': int(Config.MONTHLY_PRICE * 100),
-                                'recurring': {'interval': 'month'}
-                            },
-                            'quantity': 1,
-                        }],
+                        line_items=_STRIPE_LINE_ITEMS,
                         mode='subscription',
-                        success_url=f"{Config.BASE_URL}/api/subscribe/success?session_id={{CHECKOUT_SESSION_ID}}",
-                        cancel_url=f"{Config.BASE_URL}/api/subscribe/cancel",
+                        success_url=_STRIPE_SUCCESS_URL,
+                        cancel_url=_STRIPE_CANCEL_URL,
                         metadata={
                             'subscriber_id': subscriber.id,
                             'phone_number': subscriber.phone_number
@@ -231,24 +277,48 @@ def subscribe():
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+# Columns serialized by Subscriber.to_dict(), selected directly so the list skips ORM hydration
+SUBSCRIBER_LIST_COLUMNS = (
+    Subscriber.id, Subscriber.phone_number, Subscriber.carrier, Subscriber.email, Subscriber.name,
+    Subscriber.sms_email, Subscriber.payment_method, Subscriber.subscription_status,
+    Subscriber.timezone_offset_minutes, Subscriber.timezone_label, Subscriber.message_delivery_preference,
+    Subscriber.use_timezone_matching, Subscriber.group_id, Subscriber.created_at, Subscriber.updated_at,
+)
+
+# Rows fetched per round-trip while streaming the subscriber list
+SUBSCRIBER_STREAM_BATCH = 500
+
+def _stream_subscribers(rows):
+    """Yield the {"subscribers": [...]} document one encoded row at a time."""
+    yield '{"subscribers":['
+    separator = ''
+    for row in rows:
+        data = row._asdict()
+        # Same timestamp format as Subscriber.to_dict()
+        data['created_at'] = row.created_at.isoformat() if row.created_at else None
+        data['updated_at'] = row.updated_at.isoformat() if row.updated_at else None
+        yield separator + json_dumps(data)
+        separator = ','
+    yield ']}'
+
 @app.route('/api/subscribers', methods=['GET'])
 def get_subscribers():
-    """Get all subscribers."""
-    subscribers = Subscriber.query.all()
-    return jsonify({
-        'subscribers': [s.to_dict() for s in subscribers]
-    })
+    """Get all subscribers (streamed, so memory stays bounded by one batch)."""
+    rows = db.session.execute(
+        db.select(*SUBSCRIBER_LIST_COLUMNS).execution_options(yield_per=SUBSCRIBER_STREAM_BATCH)
+    )
+    return app.response_class(stream_with_context(_stream_subscribers(rows)), mimetype='application/json')
 
 @app.route('/api/subscribers/<int:subscriber_id>', methods=['GET'])
 def get_subscriber(subscriber_id):
     """Get a specific subscriber."""
-    subscriber = Subscriber.query.get_or_404(subscriber_id)
+    subscriber = db.get_or_404(Subscriber, subscriber_id)
     return jsonify(subscriber.to_dict())
 
 @app.route('/api/subscribers/<int:subscriber_id>', methods=['DELETE'])
 def delete_subscriber(subscriber_id):
     """Cancel subscription and delete subscriber."""
-    subscriber = Subscriber.query.get_or_404(subscriber_id)
+    subscriber = db.get_or_404(Subscriber, subscriber_id)
     
     # Cancel subscription based on payment method
     try:
@@ -265,10 +335,80 @@ def delete_subscriber(subscriber_id):
     
     return jsonify({'message': 'Subscriber deleted successfully'})
 
+# Parallel Stripe/PayPal cancellation calls for bulk subscriber deletes
+BULK_CANCEL_WORKERS = 16
+
+def _cancel_remote_subscription(payment_method, stripe_subscription_id, paypal_subscription_id):
+    """Cancel a subscription with its payment provider (API call only, safe to run off the request thread)."""
+    if payment_method == 'stripe' and stripe_subscription_id:
+        cancel_stripe_subscription_id(stripe_subscription_id)
+    elif payment_method == 'paypal' and paypal_subscription_id:
+        cancel_paypal_agreement(paypal_subscription_id)
+    # Crypto subscriptions are one-time payments, no cancellation needed
+
+@app.route('/api/subscribers', methods=['DELETE'])
+def delete_subscribers():
+    """
+    Cancel subscriptions and delete several subscribers (?ids=1,2,3).
+    
+    Subscribers with payment records (subscriptions or deposit approvals) are kept and reported
+    in 'has_payment_records', unless ?purge_payment_records=true also deletes that history.
+    """
+    try:
+        ids = {int(i) for i in request.args.get('ids', '').split(',') if i.strip()}
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+    if not ids:
+        return jsonify({'error': 'Missing required parameter: ids'}), 400
+    purge_payment_records = request.args.get('purge_payment_records', '').lower() in ('1', 'true', 'yes')
+    
+    query = db.select(
+        Subscriber.id, Subscriber.payment_method, Subscriber.stripe_subscription_id, Subscriber.paypal_subscription_id
+    ).where(Subscriber.id.in_(ids))
+    protected = []
+    if not purge_payment_records:
+        # Payment and audit history is only erased on explicit request
+        has_records = or_(
+            exists().where(Subscription.subscriber_id == Subscriber.id),
+            exists().where(DepositApproval.subscriber_id == Subscriber.id)
+        )
+        protected = db.session.execute(db.select(Subscriber.id).where(Subscriber.id.in_(ids), has_records)).scalars().all()
+        query = query.where(~has_records)
+    rows = db.session.execute(query).all()
+    found = [row.id for row in rows]
+    
+    # Provider calls run concurrently; like the single delete, a failed cancel doesn't block deletion
+    with ThreadPoolExecutor(max_workers=BULK_CANCEL_WORKERS) as executor:
+        futures = {
+            executor.submit(_cancel_remote_subscription, row.payment_method, row.stripe_subscription_id, row.paypal_subscription_id): row.id
+            for row in rows
+        }
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                logging.warning(f"Could not cancel subscription for subscriber {futures[future]}: {future.exception()}")
+    
+    try:
+        # Remove dependent rows first, then all subscribers in one statement
+        dependent_models = (ScheduledMessage, Subscription, DepositApproval) if purge_payment_records else (ScheduledMessage,)
+        for model in dependent_models:
+            db.session.execute(delete(model).where(model.subscriber_id.in_(found)))
+        db.session.execute(delete(Subscriber).where(Subscriber.id.in_(found)))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({
+        'message': f'{len(found)} subscriber(s) deleted successfully',
+        'deleted': sorted(found),
+        'has_payment_records': sorted(protected),
+        'not_found': sorted(ids.difference(found, protected))
+    })
+
 @app.route('/api/subscribers/<int:subscriber_id>/send-sms', methods=['POST'])
 def send_sms(subscriber_id):
     """Send an immediate SMS to a subscriber."""
-    subscriber = Subscriber.query.get_or_404(subscriber_id)
+    subscriber = db.get_or_404(Subscriber, subscriber_id)
     data = request.get_json()
     
     if 'message' not in data:
@@ -288,7 +428,7 @@ def send_sms(subscriber_id):
 @app.route('/api/subscribers/<int:subscriber_id>/schedule-message', methods=['POST'])
 def schedule_sms(subscriber_id):
     """Schedule a message for a subscriber."""
-    subscriber = Subscriber.query.get_or_404(subscriber_id)
+    subscriber = db.get_or_404(Subscriber, subscriber_id)
     data = request.get_json()
     
     required_fields = ['message', 'scheduled_time']
@@ -300,21 +440,15 @@ def schedule_sms(subscriber_id):
         scheduled_input = datetime.fromisoformat(data['scheduled_time'].replace('Z', '+00:00'))
         timezone_offset = subscriber.timezone_offset_minutes or 0
         timezone_label = subscriber.timezone_label or 'UTC'
-
-        def format_offset(minutes: int) -> str:
-            sign = '+' if minutes >= 0 else '-'
-            minutes_abs = abs(minutes)
-            hours = minutes_abs // 60
-            mins = minutes_abs % 60
-            return f"UTC{sign}{hours:02d}:{mins:02d}"
+        offset_delta = timedelta(minutes=timezone_offset)
 
         if scheduled_input.tzinfo is not None:
             utc_time = scheduled_input.astimezone(timezone.utc)
-            local_display = (utc_time + timedelta(minutes=timezone_offset)).replace(tzinfo=None)
+            local_display = (utc_time + offset_delta).replace(tzinfo=None)
             scheduled_utc = utc_time.replace(tzinfo=None)
         else:
             local_display = scheduled_input
-            scheduled_utc = scheduled_input - timedelta(minutes=timezone_offset)
+            scheduled_utc = scheduled_input - offset_delta
         
         # Create scheduled message
         scheduled_msg = schedule_message(
@@ -325,9 +459,7 @@ def schedule_sms(subscriber_id):
             timezone_label=timezone_label
         )
         
-        timezone_display = format_offset(timezone_offset)
-        if timezone_label and timezone_label != 'UTC':
-            timezone_display = f"{timezone_label} ({timezone_display})"
+        timezone_display = format_timezone_display(timezone_label, timezone_offset)
         
         return jsonify({
             'message': f'Message scheduled successfully for {local_display.strftime("%Y-%m-%d %H:%M:%S")} {timezone_display}',
@@ -347,6 +479,129 @@ def schedule_sms(subscriber_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Checkout Sessions retrieved by subscription_success (the success URL is often reloaded)
+CHECKOUT_SESSION_CACHE_TTL = 300
+CHECKOUT_SESSION_CACHE_MAX_SIZE = 512
+_checkout_session_cache = {}
+_checkout_session_lock = threading.Lock()
+
+def _retrieve_checkout_session(session_id):
+    """Retrieve a Stripe Checkout Session, reusing it for CHECKOUT_SESSION_CACHE_TTL seconds."""
+    with _checkout_session_lock:
+        entry = _checkout_session_cache.get(session_id)
+    if entry is not None and entry[0] > time.monotonic():
+        return entry[1]
+    
+    session = stripe.checkout.Session.retrieve(session_id)
+    with _checkout_session_lock:
+        if len(_checkout_session_cache) >= CHECKOUT_SESSION_CACHE_MAX_SIZE:
+            _checkout_session_cache.clear()
+        _checkout_session_cache[session_id] = (time.monotonic() + CHECKOUT_SESSION_CACHE_TTL, session)
+    return session
+
+def _forget_checkout_session(session_id):
+    """Drop a cached Checkout Session (Stripe sent a newer version of it)."""
+    with _checkout_session_lock:
+        _checkout_session_cache.pop(session_id, None)
+
+def _activate_stripe_subscription(subscriber, subscription_id):
+    """
+    Store a paid Stripe subscription on the subscriber and its Subscription record.
+    
+    Args:
+        subscriber: Subscriber instance from the checkout session metadata
+        subscription_id: Stripe subscription ID from the checkout session
+    """
+    subscription = stripe.Subscription.retrieve(subscription_id)
+    # Stripe timestamps are UTC epoch seconds; store naive UTC like the rest of the models
+    period_start = datetime.fromtimestamp(subscription.current_period_start, timezone.utc).replace(tzinfo=None)
+    period_end = datetime.fromtimestamp(subscription.current_period_end, timezone.utc).replace(tzinfo=None)
+    
+    # Lock the subscriber row (after the Stripe call) so a concurrent webhook and success page
+    # activation can't both miss the record below and insert two
+    db.session.refresh(subscriber, with_for_update=True)
+    
+    # Update subscriber with subscription info
+    subscriber.stripe_subscription_id = subscription.id
+    subscriber.subscription_status = subscription.status
+    
+    # Create or update subscription record
+    sub_record = Subscription.query.filter_by(
+        subscriber_id=subscriber.id,
+        payment_method='stripe'
+    ).first()
+    
+    if not sub_record:
+        sub_record = Subscription(
+            subscriber_id=subscriber.id,
+            payment_method='stripe',
+            stripe_subscription_id=subscription.id,
+            stripe_customer_id=subscriber.stripe_customer_id,
+            status=subscription.status,
+            current_period_start=period_start,
+            current_period_end=period_end
+        )
+        db.session.add(sub_record)
+    else:
+        sub_record.status = subscription.status
+        sub_record.current_period_start = period_start
+        sub_record.current_period_end = period_end
+    
+    db.session.commit()
+
+def _activate_stripe_subscription_in_background(subscriber_id, subscription_id):
+    """Run _activate_stripe_subscription on a daemon thread with its own app context."""
+    def worker():
+        with app.app_context():
+            try:
+                subscriber = db.session.get(Subscriber, subscriber_id)
+                if subscriber:
+                    _activate_stripe_subscription(subscriber, subscription_id)
+            except Exception as e:
+                logging.error(f"Error activating Stripe subscription {subscription_id}: {e}", exc_info=True)
+    
+    threading.Thread(target=worker, daemon=True).start()
+
+def _verify_stripe_signature(payload, sig_header):
+    """
+    Verify a Stripe-Signature header against the raw webhook body.
+    
+    Same checks as stripe.WebhookSignature.verify_header, but HMACs the raw bytes
+    with the one-shot hmac.digest() instead of decoding and re-encoding the body.
+    
+    Args:
+        payload: Raw request body (bytes)
+        sig_header: Value of the Stripe-Signature header
+    
+    Raises:
+        stripe.error.SignatureVerificationError: If the header is malformed, no v1
+            signature matches, or the timestamp is outside the tolerance window
+    """
+    timestamp = None
+    signatures = []
+    for item in sig_header.split(','):
+        key, _, value = item.partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value.encode('ascii', 'ignore'))
+    
+    if timestamp is None or not timestamp.isdigit() or not signatures:
+        raise stripe.error.SignatureVerificationError(
+            "Unable to extract timestamp and signatures from header", sig_header, payload
+        )
+    
+    expected = hmac.digest(_STRIPE_WEBHOOK_KEY, timestamp.encode() + b'.' + payload, 'sha256').hex().encode()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise stripe.error.SignatureVerificationError(
+            "No signatures found matching the expected signature for payload", sig_header, payload
+        )
+    
+    if int(timestamp) < time.time() - stripe.Webhook.DEFAULT_TOLERANCE:
+        raise stripe.error.SignatureVerificationError(
+            f"Timestamp outside the tolerance zone ({timestamp})", sig_header, payload
+        )
+
 @app.route('/api/stripe-webhook', methods=['POST'])
 def stripe_webhook():
     """Handle Stripe webhook events."""
@@ -355,14 +610,15 @@ def stripe_webhook():
     
     try:
         # Verify webhook signature if secret is configured
-        if Config.STRIPE_WEBHOOK_SECRET:
-            event = stripe.Webhook.construct_event(
-                payload, sig_header, Config.STRIPE_WEBHOOK_SECRET
-            )
+        if _STRIPE_WEBHOOK_KEY:
+            if not sig_header:
+                return jsonify({'error': 'Invalid signature'}), 400
+            # Check the signature on the raw body before parsing anything, then parse once with orjson
+            _verify_stripe_signature(payload, sig_header)
+            event = stripe.Event.construct_from(app.json.loads(payload), stripe.api_key)
         else:
-            # For development, parse without verification
-            import json
-            event = json.loads(payload)
+            # For development, parse without verification (orjson via the app provider)
+            event = app.json.loads(payload)
     except ValueError:
         return jsonify({'error': 'Invalid payload'}), 400
     except stripe.error.SignatureVerificationError:
@@ -375,53 +631,17 @@ def stripe_webhook():
         # Handle checkout.session.completed (when payment is collected via Checkout)
         if event_type == 'checkout.session.completed':
             session = event['data']['object'] if isinstance(event, dict) else event.data.object
+            _forget_checkout_session(session.id)
             subscriber_id = session.metadata.get('subscriber_id')
-            
-            if subscriber_id:
-                subscriber = Subscriber.query.get(subscriber_id)
-                if subscriber:
-                    # Get subscription from checkout session
-                    subscription_id = session.subscription
-                    if subscription_id:
-                        # Retrieve subscription details
-                        subscription = stripe.Subscription.retrieve(subscription_id)
-                        
-                        # Update subscriber with subscription info
-                        subscriber.stripe_subscription_id = subscription.id
-                        subscriber.subscription_status = subscription.status
-                        
-                        # Create or update subscription record
-                        from models import Subscription
-                        from datetime import datetime
-                        sub_record = Subscription.query.filter_by(
-                            subscriber_id=subscriber.id,
-                            payment_method='stripe'
-                        ).first()
-                        
-                        if not sub_record:
-                            sub_record = Subscription(
-                                subscriber_id=subscriber.id,
-                                payment_method='stripe',
-                                stripe_subscription_id=subscription.id,
-                                stripe_customer_id=subscriber.stripe_customer_id,
-                                status=subscription.status,
-                                current_period_start=datetime.fromtimestamp(subscription.current_period_start),
-                                current_period_end=datetime.fromtimestamp(subscription.current_period_end)
-                            )
-                            db.session.add(sub_record)
-                        else:
-                            sub_record.status = subscription.status
-                            sub_record.current_period_start = datetime.fromtimestamp(subscription.current_period_start)
-                            sub_record.current_period_end = datetime.fromtimestamp(subscription.current_period_end)
-                        
-                        db.session.commit()
+            subscription_id = session.subscription
+            if subscriber_id and subscription_id:
+                # Stripe only needs the 2xx; the Stripe API call and DB writes run in the background
+                _activate_stripe_subscription_in_background(int(subscriber_id), subscription_id)
         
         # Handle other subscription events
-        from subscription_manager import handle_stripe_webhook
         result = handle_stripe_webhook(event)
         return jsonify(result)
     except Exception as e:
-        import logging
         logging.error(f"Error processing Stripe webhook: {e}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
@@ -435,7 +655,7 @@ def paypal_approve():
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
-    subscriber = Subscriber.query.get_or_404(data['subscriber_id'])
+    subscriber = db.get_or_404(Subscriber, data['subscriber_id'])
     
     try:
         agreement = execute_paypal_agreement(subscriber, data['payer_id'])
@@ -453,13 +673,12 @@ def paypal_approve():
 @app.route('/api/paypal-webhook', methods=['POST'])
 def paypal_webhook():
     """Handle PayPal webhook events."""
-    event_type = request.headers.get('PAYPAL-TRANSMISSION-SIG')
-    resource = request.get_json()
+    body = request.get_json(silent=True) or {}
     
     # PayPal webhook verification would go here
     # For now, process the event
-    event_type = request.json.get('event_type')
-    resource = request.json.get('resource', {})
+    event_type = body.get('event_type')
+    resource = body.get('resource', {})
     
     try:
         result = handle_paypal_webhook(event_type, resource)
@@ -470,11 +689,8 @@ def paypal_webhook():
 @app.route('/api/crypto/wallets', methods=['GET'])
 def get_crypto_wallets():
     """Get cryptocurrency wallet addresses for manual payment."""
-    wallets = get_crypto_wallet_addresses()
-    return jsonify({
-        'wallets': wallets,
-        'monthly_price': Config.MONTHLY_PRICE
-    })
+    # Not HTTP-cached: a redeploy with new addresses must take effect immediately
+    return _static_json_response(_CRYPTO_WALLETS_JSON, cacheable=False)
 
 @app.route('/api/crypto/verify', methods=['POST'])
 def verify_crypto_payment():
@@ -486,7 +702,7 @@ def verify_crypto_payment():
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
-    subscriber = Subscriber.query.get_or_404(data['subscriber_id'])
+    subscriber = db.get_or_404(Subscriber, data['subscriber_id'])
     
     try:
         subscription = verify_manual_crypto_payment(subscriber, data['transaction_hash'])
@@ -506,6 +722,10 @@ def crypto_webhook():
     """Handle Coinbase Commerce webhook events."""
     try:
         result = handle_coinbase_webhook()
+        if isinstance(result, tuple):
+            # Errors come back as (body, status)
+            body, status = result
+            return jsonify(body), status
         return jsonify(result)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -516,53 +736,21 @@ def subscription_success():
     session_id = request.args.get('session_id')
     if session_id:
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            session = _retrieve_checkout_session(session_id)
             subscriber_id = session.metadata.get('subscriber_id')
             if subscriber_id:
-                subscriber = Subscriber.query.get(subscriber_id)
+                subscriber = db.session.get(Subscriber, int(subscriber_id))
                 if subscriber:
-                    # Get subscription from checkout session
                     subscription_id = session.subscription
-                    if subscription_id:
-                        # Retrieve subscription details
-                        subscription = stripe.Subscription.retrieve(subscription_id)
-                        
-                        # Update subscriber with subscription info
-                        subscriber.stripe_subscription_id = subscription.id
-                        subscriber.subscription_status = subscription.status
-                        
-                        # Create or update subscription record
-                        from models import Subscription
-                        from datetime import datetime
-                        sub_record = Subscription.query.filter_by(
-                            subscriber_id=subscriber.id,
-                            payment_method='stripe'
-                        ).first()
-                        
-                        if not sub_record:
-                            sub_record = Subscription(
-                                subscriber_id=subscriber.id,
-                                payment_method='stripe',
-                                stripe_subscription_id=subscription.id,
-                                stripe_customer_id=subscriber.stripe_customer_id,
-                                status=subscription.status,
-                                current_period_start=datetime.fromtimestamp(subscription.current_period_start),
-                                current_period_end=datetime.fromtimestamp(subscription.current_period_end)
-                            )
-                            db.session.add(sub_record)
-                        else:
-                            sub_record.status = subscription.status
-                            sub_record.current_period_start = datetime.fromtimestamp(subscription.current_period_start)
-                            sub_record.current_period_end = datetime.fromtimestamp(subscription.current_period_end)
-                        
-                        db.session.commit()
+                    # A reload after activation (here or by the webhook) needs no Stripe call
+                    if subscription_id and subscriber.stripe_subscription_id != subscription_id:
+                        _activate_stripe_subscription(subscriber, subscription_id)
                     
                     return jsonify({
                         'message': 'Subscription activated successfully!',
                         'subscriber': subscriber.to_dict()
                     })
         except Exception as e:
-            import logging
             logging.error(f"Error processing subscription success: {e}", exc_info=True)
             return jsonify({'error': str(e)}), 500
     return jsonify({'message': 'Subscription payment completed'})
@@ -570,17 +758,42 @@ def subscription_success():
 @app.route('/api/subscribe/cancel', methods=['GET'])
 def subscription_cancel():
     """Handle canceled subscription payment."""
-    return jsonify({'message': 'Subscription payment canceled'})
+    return _static_json_response(_SUBSCRIBE_CANCEL_JSON, cacheable=False)
 
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint."""
-    return jsonify({'status': 'healthy'})
+    # Never cached: probes must reach the process
+    return _static_json_response(_HEALTH_JSON, cacheable=False)
 
 # Global lock to prevent multiple bot instances
 _bot_running = False
 _bot_lock = threading.Lock()
 
+# Host-wide lock file so only one process on this machine polls Telegram
+BOT_LOCK_PATH = os.path.join(tempfile.gettempdir(), 'subscriptionbot-telegram.lock')
+_bot_lock_file = None
+
+def _acquire_bot_process_lock():
+    """
+    Take the host-wide Telegram bot lock (released automatically when the process exits).
+    
+    Returns:
+        bool: True if this process may run the bot
+    """
+    global _bot_lock_file
+    if fcntl is None:
+        return True
+    lock_file = open(BOT_LOCK_PATH, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    # Keep the file open for the life of the process to hold the lock
+    _bot_lock_file = lock_file
+    return True
+
 def run_telegram_bot(telegram_app):
     """Run Telegram bot in a separate thread."""
     global _bot_running
@@ -594,13 +807,6 @@ def run_telegram_bot(telegram_app):
                     return
                 _bot_running = True
             
-            # Create event loop for this thread (required for async operations in threads)
-            import asyncio
-            from telegram.error import Conflict
-            
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
             # For python-telegram-bot v21, we need to use async context properly
             async def run_bot():
                 try:
@@ -639,7 +845,6 @@ def run_telegram_bot(telegram_app):
                                     pass
                             else:
                                 # If conflicts persist, log but don't crash - bot might still work
-                                import logging
                                 logging.warning(f"Bot conflict after {max_retries} retries. Another instance may be running. Bot may still work.")
                                 # Don't raise - let it continue, sometimes it works despite conflicts
                                 break
@@ -649,10 +854,8 @@ def run_telegram_bot(telegram_app):
                     await stop_event.wait()  # Wait forever
                     
                 except Conflict as e:
-                    import logging
                     logging.error(f"Bot conflict error: {e}. Make sure only one bot instance is running.")
                 except Exception as e:
-                    import logging
                     logging.error(f"Error in bot polling: {e}", exc_info=True)
                 finally:
                     # Cleanup
@@ -666,37 +869,43 @@ def run_telegram_bot(telegram_app):
                         with _bot_lock:
                             _bot_running = False
             
-            # Run the async function
+            # Run the bot on this thread's own event loop (asyncio.run creates and closes it)
             try:
-                loop.run_until_complete(run_bot())
+                asyncio.run(run_bot())
             except KeyboardInterrupt:
                 pass
             finally:
-                loop.close()
                 with _bot_lock:
                     _bot_running = False
                 
     except Exception as e:
-        import logging
         logging.error(f"Telegram bot error: {e}", exc_info=True)
         with _bot_lock:
             _bot_running = False
 
+def _clear_telegram_webhook():
+    """Drop any Telegram webhook left over from a previous deployment."""
+    try:
+        delete_url = f"https://api.telegram.org/bot{Config.TELEGRAM_BOT_TOKEN}/deleteWebhook"
+        requests.get(delete_url, params={"drop_pending_updates": True}, timeout=5)
+        print("[OK] Cleared any existing webhooks")
+    except:
+        pass
+
 if __name__ == '__main__':
+    with app.app_context():
+        print(f"[INFO] Database pool: {db.engine.pool.status()}")
+    
     # Start scheduler
     start_scheduler(app)
     
     # Create Telegram bot application in main thread (before threading)
     # IMPORTANT: Only start bot once to avoid conflicts
-    if Config.TELEGRAM_BOT_TOKEN:
-        # Delete any existing webhook first
-        try:
-            import requests
-            delete_url = f"https://api.telegram.org/bot{Config.TELEGRAM_BOT_TOKEN}/deleteWebhook"
-            requests.get(delete_url, params={"drop_pending_updates": True}, timeout=5)
-            print("[OK] Cleared any existing webhooks")
-        except:
-            pass
+    if Config.TELEGRAM_BOT_TOKEN and not _acquire_bot_process_lock():
+        print("[INFO] Another process on this host is running the Telegram bot, skipping...")
+    elif Config.TELEGRAM_BOT_TOKEN:
+        # Delete any existing webhook in the background (run_bot deletes it again before polling)
+        threading.Thread(target=_clear_telegram_webhook, daemon=True).start()
         
         telegram_app = setup_telegram_bot()
         if telegram_app:
@@ -711,5 +920,11 @@ if __name__ == '__main__':
     # Use PORT from environment (Railway provides this) or default to 5000
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
-    app.run(debug=debug, host='0.0.0.0', port=port, use_reloader=False)
+    if serve is not None and not debug:
+        # Each request gets a worker thread, so slow Stripe/PayPal/DB calls don't queue others
+        threads = int(os.environ.get('WEB_THREADS', 16))
+        print(f"[OK] Serving with waitress on port {port} ({threads} threads)")
+        serve(app, host='0.0.0.0', port=port, threads=threads)
+    else:
+        app.run(debug=debug, host='0.0.0.0', port=port, use_reloader=False)
 
@@ -3,12 +3,17 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+def _env_int(name, default):
+    # Blank values (e.g. SMTP_PORT= in .env) fall back to the default instead of crashing the import
+    value = os.getenv(name)
+    return int(value) if value else default
+
 class Config:
     TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
     STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
     STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET')
     SMTP_HOST = os.getenv('SMTP_HOST')
-    SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
+    SMTP_PORT = _env_int('SMTP_PORT', 587)
     SMTP_USER = os.getenv('SMTP_USER')
     SMTP_PASSWORD = os.getenv('SMTP_PASSWORD')
     SENDER_EMAIL = os.getenv('SENDER_EMAIL')
@@ -20,6 +25,9 @@ class Config:
     elif _db_url.startswith('sqlite://'):
         _db_url = _db_url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
     DATABASE_URL = _db_url
+    # Connection pool sizing (Postgres); pool_size + max_overflow caps concurrent DB connections
+    DB_POOL_SIZE = _env_int('DB_POOL_SIZE', 20)
+    DB_MAX_OVERFLOW = _env_int('DB_MAX_OVERFLOW', 30)
     BASE_URL = os.getenv('BASE_URL', 'http://localhost:8000')
 
 cfg = Config()
@@ -28,10 +36,38 @@ cfg = Config()
 import asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Index, event, select, text, update as sql_update
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import datetime
 
-engine = create_async_engine(cfg.DATABASE_URL, future=True, echo=False)
+if cfg.DATABASE_URL.startswith('sqlite'):
+    # Local SQLite has no network cost, a small pool is enough
+    _engine_options = {
+        'poolclass': AsyncAdaptedQueuePool,
+        'pool_size': 5,
+        'connect_args': {'timeout': 30},  # Wait out brief write locks instead of "database is locked"
+    }
+else:
+    _engine_options = {
+        'pool_size': cfg.DB_POOL_SIZE,
+        'max_overflow': cfg.DB_MAX_OVERFLOW,
+        'pool_pre_ping': True,  # Drop stale connections (e.g. after Postgres restarts)
+        'pool_recycle': 1800,  # Recycle connections every 30 minutes
+    }
+
+engine = create_async_engine(cfg.DATABASE_URL, future=True, echo=False, **_engine_options)
+
+if engine.url.get_backend_name() == 'sqlite':
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        # WAL lets the scheduler read while webhooks write; the rest trims fsyncs and page reads
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.execute('PRAGMA cache_size=-64000')  # 64 MB
+        cursor.execute('PRAGMA mmap_size=268435456')  # 256 MB
+        cursor.close()
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 Base = declarative_base()
 
@@ -40,7 +76,7 @@ class Subscriber(Base):
     id = Column(Integer, primary_key=True, index=True)
     telegram_id = Column(String, index=True, nullable=True)
     name = Column(String, nullable=True)
-    phone = Column(String, nullable=False)
+    phone = Column(String, nullable=False, index=True)
     carrier = Column(String, nullable=False)
     sms_email = Column(String, nullable=False)
     stripe_customer_id = Column(String, nullable=True)
@@ -48,48 +84,180 @@ class Subscriber(Base):
     subscribed = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
+    __table_args__ = (
+        # Partial covering index for the daily job: only active rows, address read from the index
+        Index('ix_sub_active', 'subscribed', 'sms_email',
+              postgresql_where=text('subscribed = true'), sqlite_where=text('subscribed = 1')),
+    )
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 # helper
 async def get_subscriber_by_phone(session, phone):
+    # Only the keys the webhook path needs, via the phone index
     return (await session.execute(
-        Subscriber.__table__.select().where(Subscriber.phone == phone)
+        select(Subscriber.id, Subscriber.telegram_id).where(Subscriber.phone == phone).limit(1)
     )).first()
 
+async def activate_subscriber(checkout_session):
+    # Save (or re-activate) the subscriber described by a completed checkout's metadata, returns its id
+    metadata = checkout_session.get('metadata') or {}
+    phone, carrier = metadata.get('phone'), metadata.get('carrier')
+    if not phone or not carrier:
+        return None
+    sms_email = build_sms_email(phone, carrier)
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            row = await get_subscriber_by_phone(session, phone)
+            if row is None:
+                subscriber = Subscriber(phone=phone, carrier=carrier, sms_email=sms_email)
+                session.add(subscriber)
+            else:
+                subscriber = await session.get(Subscriber, row.id)
+                subscriber.carrier, subscriber.sms_email = carrier, sms_email
+            subscriber.name = metadata.get('name') or subscriber.name
+            subscriber.telegram_id = metadata.get('telegram_id') or subscriber.telegram_id
+            subscriber.stripe_customer_id = checkout_session.get('customer')
+            subscriber.stripe_subscription_id = checkout_session.get('subscription')
+            subscriber.subscribed = True
+            await session.flush()
+            return subscriber.id
+
+async def deactivate_subscriber(stripe_subscription_id):
+    # Mark the subscriber on a canceled Stripe subscription as unsubscribed, returns its id
+    if not stripe_subscription_id:
+        return None
+    async with AsyncSessionLocal() as session:
+        async with session.begin():
+            subscriber_id = (await session.execute(
+                sql_update(Subscriber)
+                .where(Subscriber.stripe_subscription_id == stripe_subscription_id)
+                .values(subscribed=False)
+                .returning(Subscriber.id)
+            )).scalar()
+    return subscriber_id
+
 # ======== email_sender.py ========
 import asyncio
+import contextlib
 from email.message import EmailMessage
 import aiosmtplib
 
+SMTP_POOL_SIZE = 5
+SMTP_MESSAGES_PER_CONNECTION = 100  # reconnect after this many messages, servers cap long sessions
+
+class SmtpPool:
+    # Logged-in SMTP connections reused across sends, so each message doesn't pay connect + STARTTLS + AUTH
+    def __init__(self, size=SMTP_POOL_SIZE, max_messages=SMTP_MESSAGES_PER_CONNECTION):
+        self.max_messages = max_messages
+        self._slots = asyncio.Queue()
+        for _ in range(size):
+            self._slots.put_nowait([None, 0])  # [client, messages sent on it]
+
+    async def _connect(self):
+        smtp = aiosmtplib.SMTP(hostname=cfg.SMTP_HOST, port=cfg.SMTP_PORT,
+                               username=cfg.SMTP_USER, password=cfg.SMTP_PASSWORD, start_tls=True)
+        await smtp.connect()  # connects, upgrades with STARTTLS and logs in
+        return smtp
+
+    @staticmethod
+    async def _quit(smtp):
+        with contextlib.suppress(aiosmtplib.SMTPException, OSError):
+            await smtp.quit()
+
+    async def fill(self):
+        # Open every connection up front so the first scheduled run doesn't pay for it
+        slots = [self._slots.get_nowait() for _ in range(self._slots.qsize())]
+        try:
+            for slot in slots:
+                if slot[0] is None:
+                    slot[0], slot[1] = await self._connect(), 0
+        finally:
+            for slot in slots:
+                self._slots.put_nowait(slot)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, fresh=False):
+        slot = await self._slots.get()
+        try:
+            smtp, sent = slot
+            if fresh or smtp is None or not smtp.is_connected or sent >= self.max_messages:
+                if smtp is not None and smtp.is_connected:
+                    await self._quit(smtp)
+                slot[0], slot[1] = None, 0
+                slot[0] = await self._connect()
+            yield slot[0]
+            slot[1] += 1
+        except aiosmtplib.SMTPServerDisconnected:
+            slot[0] = None  # reconnect on next use
+            raise
+        finally:
+            self._slots.put_nowait(slot)
+
+    async def close(self):
+        for _ in range(self._slots.qsize()):
+            slot = self._slots.get_nowait()
+            if slot[0] is not None and slot[0].is_connected:
+                await self._quit(slot[0])
+            slot[0], slot[1] = None, 0
+            self._slots.put_nowait(slot)
+
+smtp_pool = SmtpPool()
+
 async def send_sms_via_email(to_address: str, message: str):
     msg = EmailMessage()
     msg['From'] = cfg.SENDER_EMAIL
     msg['To'] = to_address
     msg['Subject'] = ''
     msg.set_content(message)
-    await aiosmtplib.send(msg, hostname=cfg.SMTP_HOST, port=cfg.SMTP_PORT,
-                           username=cfg.SMTP_USER, password=cfg.SMTP_PASSWORD, start_tls=True)
+    try:
+        async with smtp_pool.acquire() as smtp:
+            await smtp.send_message(msg)
+    except aiosmtplib.SMTPServerDisconnected:
+        # The pooled connection was dropped by the server, retry once on a fresh one
+        async with smtp_pool.acquire(fresh=True) as smtp:
+            await smtp.send_message(msg)
 
 # ======== payments.py ========
+import requests
 import stripe
+from concurrent.futures import ThreadPoolExecutor
 stripe.api_key = cfg.STRIPE_API_KEY
 
 PRICE_ID = 'price_monthly_1_60_usd_placeholder'  # Create this in Stripe dashboard
 
-async def create_checkout_session(customer_email, phone, success_url=None, cancel_url=None):
+# Dedicated threads for blocking Stripe SDK calls, so button-press bursts don't starve the default executor
+STRIPE_EXECUTOR_WORKERS = 32
+_stripe_executor = ThreadPoolExecutor(max_workers=STRIPE_EXECUTOR_WORKERS, thread_name_prefix='stripe')
+
+# One keep-alive connection pool to api.stripe.com shared by all Stripe threads
+# (by default each thread opens its own session and pays its own TLS handshake)
+_stripe_http_session = requests.Session()
+_stripe_http_session.mount('https://', requests.adapters.HTTPAdapter(pool_maxsize=STRIPE_EXECUTOR_WORKERS))
+stripe.default_http_client = stripe.http_client.RequestsClient(session=_stripe_http_session)
+
+def _create_checkout_session_sync(customer_email, phone, success_url, cancel_url, metadata=None):
     # Create a customer then a checkout session for subscription
     customer = stripe.Customer.create(email=customer_email, metadata={'phone': phone})
     session = stripe.checkout.Session.create(
         customer=customer.id,
         mode='subscription',
+        metadata=metadata or {'phone': phone},  # read back by the checkout.session.completed webhook
         line_items=[{'price': PRICE_ID, 'quantity': 1}],
         success_url=success_url or cfg.BASE_URL + '/success?session_id={CHECKOUT_SESSION_ID}',
         cancel_url=cancel_url or cfg.BASE_URL + '/cancel',
     )
     return session
 
+async def create_checkout_session(customer_email, phone, success_url=None, cancel_url=None, metadata=None):
+    # Both Stripe calls run in a single hop to the Stripe thread pool
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _stripe_executor, _create_checkout_session_sync, customer_email, phone, success_url, cancel_url, metadata
+    )
+
 # Webhook handler (FastAPI route will call)
 from fastapi import HTTPException
 
@@ -102,23 +270,52 @@ def handle_stripe_event(event):
 # ======== scheduler.py ========
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.jobstores.base import JobLookupError
 import asyncio
 
 scheduler = AsyncIOScheduler()
 
+SUBSCRIBER_BATCH_SIZE = 500  # rows fetched per round-trip when scanning subscribers
+DAILY_MESSAGE = "Your scheduled message from Bot"  # customize per user if needed
+DAILY_SEND_HOUR = 9  # server time
+
+async def send_daily_message(send_fn, subscriber_id):
+    # Re-read the row at fire time: the address may have changed, and a stale job must never message
+    # someone who unsubscribed (it removes itself instead)
+    async with AsyncSessionLocal() as session:
+        row = (await session.execute(
+            select(Subscriber.sms_email, Subscriber.subscribed).where(Subscriber.id == subscriber_id)
+        )).first()
+    if row is None or not row.subscribed:
+        unschedule_subscriber(subscriber_id)
+        return
+    await send_fn(row.sms_email, DAILY_MESSAGE)
+
+def schedule_subscriber(send_fn, subscriber_id):
+    # One daily job per subscriber, offset within the hour by id so sends are spread out instead of all at 09:00:00
+    scheduler.add_job(
+        send_daily_message, CronTrigger(hour=DAILY_SEND_HOUR, minute=subscriber_id % 60),
+        args=[send_fn, subscriber_id], id=f'daily-{subscriber_id}', replace_existing=True,
+        misfire_grace_time=3600, coalesce=True,
+    )
+
+def unschedule_subscriber(subscriber_id):
+    with contextlib.suppress(JobLookupError):
+        scheduler.remove_job(f'daily-{subscriber_id}')
+
 async def start_scheduler(send_fn):
     # send_fn should be an async function accepting (to_address, message)
-    # Example: schedule daily message to everyone
-    async def job_all():
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(Subscriber.__table__.select().where(Subscriber.subscribed == True))
-            rows = result.fetchall()
-            for r in rows:
-                to = r._mapping['sms_email']
-                # customize message per user if needed
-                await send_fn(to, "Your scheduled message from Bot")
-
-    scheduler.add_job(job_all, CronTrigger(hour=9, minute=0))  # daily at 09:00 server time
+    # Register every active subscriber's daily job at startup; the Stripe webhook adds and removes jobs after that
+    stmt = (
+        select(Subscriber.id)
+        .where(Subscriber.subscribed == True)  # "= true" (not IS) so the partial ix_sub_active applies
+        .execution_options(yield_per=SUBSCRIBER_BATCH_SIZE)
+    )
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(stmt)
+        async for partition in result.partitions():
+            for r in partition:
+                schedule_subscriber(send_fn, r.id)
     scheduler.start()
 
 # ======== telecom_gateways.py ========
@@ -130,12 +327,22 @@ CARRIER_GATEWAYS = {
     'tmobile': 'tmomail.net',
 }
 
+# Deletes every Latin-1 non-digit in one C-level str.translate pass
+_DIGIT_TABLE = str.maketrans('', '', ''.join(chr(c) for c in range(256) if not chr(c).isdigit()))
+
+def digits_only(text: str):
+    cleaned = text.translate(_DIGIT_TABLE)
+    if cleaned and not cleaned.isdigit():
+        # Characters outside Latin-1 survive the table, drop them the slow way
+        cleaned = ''.join(ch for ch in cleaned if ch.isdigit())
+    return cleaned
+
 def build_sms_email(phone: str, carrier_key: str):
-    domain = CARRIER_GATEWAYS.get(carrier_key.lower())
+    # carrier_key comes from the carrier keyboard's callback data, i.e. an exact CARRIER_GATEWAYS key
+    domain = CARRIER_GATEWAYS.get(carrier_key)
     if not domain:
         raise ValueError('Unknown carrier')
-    cleaned = ''.join(ch for ch in phone if ch.isdigit())
-    return f"{cleaned}@{domain}"
+    return f"{digits_only(phone)}@{domain}"
 
 # ======== bot_main.py ========
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
@@ -144,6 +351,10 @@ import asyncio
 
 TELEGRAM_TOKEN = cfg.TELEGRAM_TOKEN
 
+# The carrier keyboard is the same for every user, build it once
+_CARRIER_KB_BUTTONS = [InlineKeyboardButton(k.title(), callback_data=f'carrier::{k}') for k in CARRIER_GATEWAYS]
+CARRIER_KEYBOARD = InlineKeyboardMarkup([_CARRIER_KB_BUTTONS[i:i+2] for i in range(0, len(_CARRIER_KB_BUTTONS), 2)])
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text("Welcome! Send /subscribe to begin subscription.")
 
@@ -162,12 +373,10 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_data['awaiting_phone'] = True
         return
     if user_data.get('awaiting_phone'):
-        phone = ''.join(ch for ch in text if ch.isdigit())
+        phone = digits_only(text)
         user_data['phone'] = phone
         # ask carrier selection
-        buttons = [InlineKeyboardButton(k.title(), callback_data=f'carrier::{k}') for k in CARRIER_GATEWAYS.keys()]
-        kb = InlineKeyboardMarkup([buttons[i:i+2] for i in range(0, len(buttons), 2)])
-        await update.message.reply_text('Choose your carrier:', reply_markup=kb)
+        await update.message.reply_text('Choose your carrier:', reply_markup=CARRIER_KEYBOARD)
         return
 
 async def carrier_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -183,10 +392,26 @@ async def carrier_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Create Stripe checkout session (web link)
         # In real app collect user email; here we'll reuse telegram username as a fallback
         email = update.effective_user.username or f'tg_{update.effective_user.id}@example.com'
-        session = await asyncio.to_thread(create_checkout_session, email, phone)
-        checkout_url = session.url
-        await query.edit_message_text(f"Ready to subscribe. Click to pay: {checkout_url}")
-        # Save partial data to DB after payment webhook confirms
+        # Everything the payment webhook needs to save the subscriber once checkout completes
+        metadata = {
+            'phone': phone,
+            'carrier': carrier,
+            'name': context.user_data.get('name') or '',
+            'telegram_id': str(update.effective_user.id),
+        }
+        await query.edit_message_text("Creating your checkout link…")
+        # Stripe calls run after the handler returns; the application keeps a reference to the task
+        context.application.create_task(_finalize_checkout(query, email, phone, metadata), update=update)
+        # Subscriber is saved to DB when the payment webhook confirms
+
+async def _finalize_checkout(query, email, phone, metadata=None):
+    try:
+        session = await create_checkout_session(email, phone, metadata=metadata)
+    except Exception as e:
+        print(f"[ERROR] Could not create checkout session: {e}")
+        await query.edit_message_text("Sorry, we couldn't create your checkout link. Please try again with /subscribe.")
+        return
+    await query.edit_message_text(f"Ready to subscribe. Click to pay: {session.url}")
 
 async def main_bot():
     app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
@@ -205,29 +430,55 @@ from fastapi import FastAPI, Request, BackgroundTasks
 import uvicorn
 import json
 
-app = FastAPI()
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+    json_loads = orjson.loads
+except ImportError:  # orjson is optional, use stdlib json instead
+    from fastapi.responses import JSONResponse as DefaultResponse
+    json_loads = json.loads
+
+app = FastAPI(default_response_class=DefaultResponse)
 
 @app.on_event('startup')
 async def startup_event():
     await init_db()
+    try:
+        await smtp_pool.fill()
+    except Exception as e:
+        # Not fatal, connections are opened lazily on first send
+        print(f"[WARNING] Could not pre-open SMTP connections: {e}")
     # start scheduler with email sender
     await start_scheduler(send_sms_via_email)
 
+@app.on_event('shutdown')
+async def shutdown_event():
+    await smtp_pool.close()
+
 @app.post('/stripe/webhook')
 async def stripe_webhook(request: Request):
     payload = await request.body()
     sig = request.headers.get('stripe-signature')
     try:
-        event = stripe.Webhook.construct_event(payload, sig, cfg.STRIPE_WEBHOOK_SECRET)
+        # Verify the raw body, then parse it once (construct_event would parse it with stdlib json)
+        stripe.WebhookSignature.verify_header(
+            payload.decode('utf-8'), sig, cfg.STRIPE_WEBHOOK_SECRET, stripe.Webhook.DEFAULT_TOLERANCE
+        )
+        event = stripe.Event.construct_from(json_loads(payload), stripe.api_key)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     typ, data = handle_stripe_event(event)
     # Example: handle subscription created
     if typ == 'checkout.session.completed':
-        session = data
-        # Retrieve customer, metadata (phone)
-        cust_id = session.get('customer')
-        # You would now find the phone/metadata and mark user subscribed in DB
+        # Save the subscriber from the checkout metadata (phone, carrier) and start their daily job
+        subscriber_id = await activate_subscriber(data)
+        if subscriber_id is not None:
+            schedule_subscriber(send_sms_via_email, subscriber_id)
+    elif typ == 'customer.subscription.deleted':
+        # Stop the daily job right away; send_daily_message also skips rows that are no longer subscribed
+        subscriber_id = await deactivate_subscriber(data.get('id'))
+        if subscriber_id is not None:
+            unschedule_subscriber(subscriber_id)
     return {'ok': True}
 
 @app.get('/')
@@ -238,14 +489,13 @@ async def index():
 import asyncio
 
 if __name__ == '__main__':
-    # Run both FastAPI server and Telegram bot concurrently
-    import multiprocessing
+    # Run both FastAPI server and Telegram bot concurrently on one event loop
     async def runner():
         # start bot
         bot_task = asyncio.create_task(main_bot())
-        # start uvicorn server in thread/subprocess
+        # serve this module's app object on the same loop ('server:app' would import a module that doesn't exist)
         from uvicorn import Config, Server
-        config = Config('server:app', host='0.0.0.0', port=8000, log_level='info')
+        config = Config(app, host='0.0.0.0', port=8000, log_level='info')
         server = Server(config)
         srv_task = asyncio.create_task(server.serve())
         await asyncio.gather(bot_task, srv_task)
@@ -4,13 +4,19 @@ Checks all configuration, dependencies, and setup status
 Run: python check_setup.py
 """
 
+import importlib.metadata
 import os
 import sys
 from pathlib import Path
 
-def check_file_exists(filepath, description):
-    """Check if a file exists."""
-    exists = Path(filepath).exists()
+def list_project_files():
+    """Get the names of all files in the project root with a single directory scan."""
+    with os.scandir('.') as entries:
+        return {entry.name for entry in entries if entry.is_file()}
+
+def check_file_exists(filepath, description, project_files=None):
+    """Check if a file exists (looked up in project_files when given, instead of a stat per file)."""
+    exists = filepath in project_files if project_files is not None else Path(filepath).exists()
     status = "[OK]" if exists else "[MISSING]"
     print(f"{status} {description}: {filepath}")
     return exists
@@ -32,15 +38,18 @@ def check_env_variable(var_name, description, required=True):
         print(f"{status} {description}: Not set {req_text}")
         return not required
 
-def check_python_package(package_name):
+def get_installed_modules():
+    """Get the importable top-level module names of all installed distributions plus the stdlib."""
+    # One metadata scan instead of importing (and initializing) every package
+    return set(importlib.metadata.packages_distributions()) | set(sys.stdlib_module_names)
+
+def check_python_package(package_name, installed_modules):
     """Check if a Python package is installed."""
-    try:
-        __import__(package_name)
+    if package_name in installed_modules:
         print(f"[OK] {package_name}: Installed")
         return True
-    except ImportError:
-        print(f"[MISSING] {package_name}: Not installed")
-        return False
+    print(f"[MISSING] {package_name}: Not installed")
+    return False
 
 def check_database():
     """Check if database file exists."""
@@ -77,8 +86,9 @@ def main():
         ("requirements.txt", "Dependencies list"),
     ]
     
+    project_files = list_project_files()
     for filepath, desc in required_files:
-        all_checks.append(check_file_exists(filepath, desc))
+        all_checks.append(check_file_exists(filepath, desc, project_files))
     
     # Check database
     print("\n[DATABASE CHECK]")
@@ -88,12 +98,12 @@ def main():
     # Check .env file
     print("\n[CONFIGURATION CHECK - .env file]")
     print("-" * 70)
-    env_exists = Path(".env").exists()
+    env_exists = ".env" in project_files
     if env_exists:
         print("[OK] .env file: Found")
-        # Load and check variables
+        # Load and check variables (explicit path, no need for find_dotenv to search for it)
         from dotenv import load_dotenv
-        load_dotenv()
+        load_dotenv(dotenv_path=".env")
     else:
         print("[MISSING] .env file: Not found (REQUIRED)")
         print("   Create .env file with required configuration")
@@ -145,23 +155,9 @@ def main():
         "smtplib",
     ]
     
+    installed_modules = get_installed_modules()
     for package in required_packages:
-        # Handle different import names
-        import_name = package
-        if package == "flask_sqlalchemy":
-            import_name = "flask_sqlalchemy"
-        elif package == "flask_cors":
-            import_name = "flask_cors"
-        elif package == "coinbase_commerce":
-            import_name = "coinbase_commerce"
-        elif package == "telegram":
-            import_name = "telegram"
-        elif package == "dotenv":
-            import_name = "dotenv"
-        elif package == "smtplib":
-            import_name = "smtplib"  # Built-in
-        
-        all_checks.append(check_python_package(import_name))
+        all_checks.append(check_python_package(package, installed_modules))
     
     # Check SMTP configuration (for message sending)
     print("\n[SMTP CONFIGURATION - for sending messages]")
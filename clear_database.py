@@ -7,12 +7,35 @@ This script will delete all records from all tables
 from flask import Flask
 from config import Config
 from models import db, Subscriber, ScheduledMessage, Subscription, DepositApproval
+from sqlalchemy import func, select
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config.from_object(Config)
 db.init_app(app)
 
+def count_records():
+    """
+    Count the rows of all cleared tables in a single query.
+    
+    Returns:
+        Row: (subscribers, scheduled_messages, subscriptions, deposit_approvals)
+    """
+    return db.session.execute(select(
+        select(func.count()).select_from(Subscriber).scalar_subquery(),
+        select(func.count()).select_from(ScheduledMessage).scalar_subquery(),
+        select(func.count()).select_from(Subscription).scalar_subquery(),
+        select(func.count()).select_from(DepositApproval).scalar_subquery(),
+    )).one()
+
+def print_counts(counts):
+    """Print the per-table record counts returned by count_records()."""
+    subscriber_count, message_count, subscription_count, deposit_count = counts
+    print(f"  - Subscribers: {subscriber_count}")
+    print(f"  - Scheduled Messages: {message_count}")
+    print(f"  - Subscriptions: {subscription_count}")
+    print(f"  - Deposit Approvals: {deposit_count}")
+
 def clear_all_data():
     """Clear all data from all tables."""
     with app.app_context():
@@ -31,33 +54,20 @@ def clear_all_data():
         
         try:
             # Count records before deletion
-            subscriber_count = Subscriber.query.count()
-            message_count = ScheduledMessage.query.count()
-            subscription_count = Subscription.query.count()
-            deposit_count = DepositApproval.query.count()
-            
             print(f"\n📊 Current data:")
-            print(f"  - Subscribers: {subscriber_count}")
-            print(f"  - Scheduled Messages: {message_count}")
-            print(f"  - Subscriptions: {subscription_count}")
-            print(f"  - Deposit Approvals: {deposit_count}")
+            print_counts(count_records())
             
-            # Delete all records
+            # Delete all records (plain table DELETEs, children before subscribers)
             print("\n🗑️  Deleting data...")
             
-            ScheduledMessage.query.delete()
-            DepositApproval.query.delete()
-            Subscription.query.delete()
-            Subscriber.query.delete()
+            for model in (ScheduledMessage, DepositApproval, Subscription, Subscriber):
+                db.session.execute(model.__table__.delete())
             
             db.session.commit()
             
             print("✅ All data cleared successfully!")
             print("\n📊 Remaining records:")
-            print(f"  - Subscribers: {Subscriber.query.count()}")
-            print(f"  - Scheduled Messages: {ScheduledMessage.query.count()}")
-            print(f"  - Subscriptions: {Subscription.query.count()}")
-            print(f"  - Deposit Approvals: {DepositApproval.query.count()}")
+            print_counts(count_records())
             
         except Exception as e:
             db.session.rollback()
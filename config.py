@@ -3,6 +3,11 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _env_int(name, default):
+    """Read an integer setting, falling back to the default when it is unset or blank."""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
 class Config:
     # Database
     # Railway provides DATABASE_URL automatically for PostgreSQL
@@ -14,6 +19,15 @@ class Config:
     SQLALCHEMY_DATABASE_URI = database_url or 'sqlite:///subscription_service.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool - reuse connections across requests instead of reconnecting each time
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': _env_int('DB_POOL_SIZE', 20),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_pre_ping': True,  # Drop stale connections (e.g. after Postgres restarts)
+        'pool_recycle': 1800,  # Recycle connections every 30 minutes
+        'pool_use_lifo': True,  # Reuse the most recent connection so idle ones can time out
+    }
+    
     # Stripe
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
@@ -43,7 +57,7 @@ class Config:
     
     # Email/SMS Configuration
     SMTP_SERVER = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
-    SMTP_PORT = int(os.environ.get('SMTP_PORT', 587))
+    SMTP_PORT = _env_int('SMTP_PORT', 587)
     SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
     SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
     SMTP_FROM_EMAIL = os.environ.get('SMTP_FROM_EMAIL')
@@ -1,20 +1,91 @@
 import coinbase_commerce
 from coinbase_commerce.client import Client
 from coinbase_commerce.webhook import Webhook
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from flask import current_app, request
+from sqlalchemy import inspect
 from config import Config
-from models import db, Subscriber, Subscription
+from json_provider import loads as json_loads
+from models import db, Subscriber, Subscription, SubscriptionPlan
 from plan_manager import get_default_plan
 import hmac
-import hashlib
-import json
+import threading
+import time
 
 # Initialize Coinbase Commerce client
 crypto_client = None
 if Config.COINBASE_COMMERCE_API_KEY:
     crypto_client = Client(api_key=Config.COINBASE_COMMERCE_API_KEY)
 
+# Short-lived cache of Coinbase checkout ID -> subscriber ID, so webhook retries skip the lookup query
+CHECKOUT_SUBSCRIBER_CACHE_TTL = 300  # seconds
+CHECKOUT_SUBSCRIBER_CACHE_MAX_SIZE = 512
+_checkout_subscriber_cache = {}
+_checkout_subscriber_lock = threading.Lock()
+
+# Webhook signing secret as bytes, encoded once instead of per webhook
+_WEBHOOK_SECRET_BYTES = (
+    Config.COINBASE_COMMERCE_WEBHOOK_SECRET.encode() if Config.COINBASE_COMMERCE_WEBHOOK_SECRET else None
+)
+
+# Wallet addresses are read from the environment once at startup, so bind them at import
+_CRYPTO_WALLETS = Config.CRYPTO_WALLETS
+
+# Currencies with a configured wallet address, filtered once (get_crypto_wallet_addresses hands out copies)
+_CONFIGURED_WALLETS = {currency: address for currency, address in _CRYPTO_WALLETS.items() if address}
+_AVAILABLE_CRYPTO_CURRENCIES = tuple(_CONFIGURED_WALLETS)
+
+def _subscriber_id_for_checkout(checkout_id):
+    """
+    Get the ID of the subscriber a Coinbase checkout belongs to (cached for CHECKOUT_SUBSCRIBER_CACHE_TTL seconds).
+    
+    Args:
+        checkout_id: Coinbase Commerce checkout ID
+    
+    Returns:
+        int or None: Subscriber ID, or None if no subscriber has this checkout
+    """
+    now = time.monotonic()
+    with _checkout_subscriber_lock:
+        entry = _checkout_subscriber_cache.get(checkout_id)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+    
+    subscriber_id = db.session.query(Subscriber.id).filter_by(crypto_payment_address=checkout_id).limit(1).scalar()
+    if subscriber_id is None:
+        # Misses aren't cached: the checkout may just not be committed yet
+        return None
+    
+    with _checkout_subscriber_lock:
+        if len(_checkout_subscriber_cache) >= CHECKOUT_SUBSCRIBER_CACHE_MAX_SIZE:
+            _checkout_subscriber_cache.clear()
+        _checkout_subscriber_cache[checkout_id] = (now + CHECKOUT_SUBSCRIBER_CACHE_TTL, subscriber_id)
+    return subscriber_id
+
+def _forget_checkout_subscriber(checkout_id):
+    """Drop a cached checkout -> subscriber mapping (call before a subscriber's payment address changes)."""
+    if checkout_id:
+        with _checkout_subscriber_lock:
+            _checkout_subscriber_cache.pop(checkout_id, None)
+
+def _subscriber_plan(subscriber):
+    """
+    Get a subscriber's plan, falling back to the default plan.
+    Uses the relationship if it is already loaded (e.g. via joinedload(Subscriber.plan)),
+    otherwise looks the plan up through the session's identity map before querying.
+    
+    Args:
+        subscriber: Subscriber model instance
+    
+    Returns:
+        SubscriptionPlan or None
+    """
+    if not subscriber.plan_id:
+        return get_default_plan()
+    if 'plan' not in inspect(subscriber).unloaded:
+        return subscriber.plan
+    return db.session.get(SubscriptionPlan, subscriber.plan_id)
+
 def create_crypto_checkout(subscriber, plan=None, final_price=None):
     """
     Create a cryptocurrency payment checkout using Coinbase Commerce.
@@ -32,7 +103,7 @@ def create_crypto_checkout(subscriber, plan=None, final_price=None):
     
     # Get plan
     if not plan:
-        plan = subscriber.plan if subscriber.plan_id else get_default_plan()
+        plan = _subscriber_plan(subscriber)
         if not plan:
             raise ValueError("No subscription plan found. Please create a plan first.")
     
@@ -56,6 +127,7 @@ def create_crypto_checkout(subscriber, plan=None, final_price=None):
         }
     )
     
+    _forget_checkout_subscriber(subscriber.crypto_payment_address)
     subscriber.crypto_payment_address = checkout.id
     subscriber.payment_method = 'crypto'
     subscriber.subscription_status = 'pending'
@@ -105,6 +177,9 @@ def activate_crypto_subscription(subscriber, transaction_hash=None):
     if transaction_hash:
         subscriber.crypto_transaction_hash = transaction_hash
     
+    # Naive UTC, matching the DateTime columns; taken once so the period is exactly 30 days
+    period_start = datetime.now(timezone.utc).replace(tzinfo=None)
+    
     # Create subscription record
     sub_record = Subscription(
         subscriber_id=subscriber.id,
@@ -112,8 +187,8 @@ def activate_crypto_subscription(subscriber, transaction_hash=None):
         crypto_payment_id=subscriber.crypto_payment_address,
         crypto_transaction_hash=transaction_hash,
         status='active',
-        current_period_start=datetime.utcnow(),
-        current_period_end=datetime.utcnow() + timedelta(days=30)
+        current_period_start=period_start,
+        current_period_end=period_start + timedelta(days=30)
     )
     db.session.add(sub_record)
     db.session.commit()
@@ -127,34 +202,41 @@ def handle_coinbase_webhook():
     Returns:
         dict: Response
     """
-    if not Config.COINBASE_COMMERCE_WEBHOOK_SECRET:
+    if not _WEBHOOK_SECRET_BYTES:
         return {'error': 'Webhook secret not configured'}, 400
     
     signature = request.headers.get('X-CC-Webhook-Signature')
-    payload = request.data
+    # Raw body, buffered once and cached on the request for anything that reads it later
+    payload = request.get_data(cache=True)
     
-    # Verify webhook signature
-    expected_signature = hmac.new(
-        Config.COINBASE_COMMERCE_WEBHOOK_SECRET.encode(),
-        payload,
-        hashlib.sha256
-    ).hexdigest()
+    if not signature:
+        return {'error': 'Invalid signature'}, 400
     
-    if signature != expected_signature:
+    # Decode the hex header once and compare raw digests instead of hex-encoding ours
+    try:
+        received_signature = bytes.fromhex(signature)
+    except ValueError:
+        return {'error': 'Invalid signature'}, 400
+    
+    # Verify webhook signature (one-shot HMAC, no Python-level hmac object)
+    expected_signature = hmac.digest(_WEBHOOK_SECRET_BYTES, payload, 'sha256')
+    
+    # Constant-time compare so response timing doesn't leak how much of the signature matched
+    if not hmac.compare_digest(received_signature, expected_signature):
         return {'error': 'Invalid signature'}, 400
     
     try:
-        event = json.loads(payload)
+        event = json_loads(payload)
         event_type = event.get('type')
         checkout = event.get('data')
         
         if event_type == 'checkout:confirmed':
             checkout_id = checkout.get('id')
-            subscriber = Subscriber.query.filter_by(
-                crypto_payment_address=checkout_id
-            ).first()
+            subscriber_id = _subscriber_id_for_checkout(checkout_id)
+            subscriber = db.session.get(Subscriber, subscriber_id) if subscriber_id else None
             
-            if subscriber:
+            # Coinbase redelivers webhooks: don't activate (and add a Subscription record) twice
+            if subscriber and subscriber.crypto_payment_address == checkout_id and subscriber.subscription_status != 'active':
                 activate_crypto_subscription(subscriber)
         
         elif event_type == 'charge:confirmed':
@@ -177,26 +259,18 @@ def get_crypto_wallet_addresses():
     Get cryptocurrency wallet addresses for manual payment.
     
     Returns:
-        dict: Wallet addresses by currency
+        dict: Wallet addresses by currency (a fresh copy, safe to modify)
     """
-    return {
-        currency: address
-        for currency, address in Config.CRYPTO_WALLETS.items()
-        if address
-    }
+    return dict(_CONFIGURED_WALLETS)
 
 def get_available_crypto_currencies():
     """
-    Get list of available cryptocurrency currencies that have wallet addresses configured.
+    Get available cryptocurrency currencies that have wallet addresses configured.
     
     Returns:
-        list: List of currency codes (e.g., ['BTC', 'ETH', 'USDC'])
+        tuple: Currency codes (e.g., ('BTC', 'ETH', 'USDC'))
     """
-    return [
-        currency
-        for currency, address in Config.CRYPTO_WALLETS.items()
-        if address
-    ]
+    return _AVAILABLE_CRYPTO_CURRENCIES
 
 def create_manual_crypto_subscription(subscriber, currency='BTC', transaction_hash=None, plan=None, final_price=None):
     """
@@ -217,14 +291,14 @@ def create_manual_crypto_subscription(subscriber, currency='BTC', transaction_ha
     
     # Get plan
     if not plan:
-        plan = subscriber.plan if subscriber.plan_id else get_default_plan()
+        plan = _subscriber_plan(subscriber)
         if not plan:
             raise ValueError("No subscription plan found. Please create a plan first.")
     
     # Use final price if provided, otherwise use plan price
     price_to_use = final_price if final_price is not None else float(plan.price)
     
-    wallet_address = Config.CRYPTO_WALLETS.get(currency)
+    wallet_address = _CRYPTO_WALLETS.get(currency)
     
     if not wallet_address:
         env_var_name = f"{currency}_WALLET_ADDRESS"
@@ -236,6 +310,7 @@ def create_manual_crypto_subscription(subscriber, currency='BTC', transaction_ha
         )
     
     subscriber.payment_method = 'crypto'
+    _forget_checkout_subscriber(subscriber.crypto_payment_address)
     subscriber.crypto_payment_address = wallet_address
     subscriber.subscription_status = 'pending'
     
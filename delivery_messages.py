@@ -92,6 +92,26 @@ Your subscription is now active. Get ready for regular updates delivered straigh
 
 Thank you for subscribing!"""
 
+# Static messages by language and type (the professional template is formatted per call)
+_MESSAGES = {
+    'en': {
+        'welcome': WELCOME_MESSAGE,
+        'activation': ACTIVATION_MESSAGE,
+        'payment_confirmed': PAYMENT_CONFIRMED,
+        'payment_approved': PAYMENT_APPROVED,
+        'service_active': SERVICE_ACTIVE,
+        'delivery_confirmed': DELIVERY_CONFIRMED,
+        'simple': SIMPLE_DELIVERY,
+        'friendly': FRIENDLY_DELIVERY,
+    },
+    'bn': {
+        'welcome': WELCOME_MESSAGE_BN,
+        'activation': ACTIVATION_MESSAGE_BN,
+        'payment_confirmed': PAYMENT_CONFIRMED_BN,
+        'payment_approved': PAYMENT_APPROVED_BN,
+    }
+}
+
 # Get message by type
 def get_delivery_message(message_type='welcome', language='en', **kwargs):
     """
@@ -105,33 +125,17 @@ def get_delivery_message(message_type='welcome', language='en', **kwargs):
     Returns:
         str: Delivery message
     """
-    messages = {
-        'en': {
-            'welcome': WELCOME_MESSAGE,
-            'activation': ACTIVATION_MESSAGE,
-            'payment_confirmed': PAYMENT_CONFIRMED,
-            'payment_approved': PAYMENT_APPROVED,
-            'service_active': SERVICE_ACTIVE,
-            'delivery_confirmed': DELIVERY_CONFIRMED,
-            'simple': SIMPLE_DELIVERY,
-            'friendly': FRIENDLY_DELIVERY,
-            'professional': PROFESSIONAL_DELIVERY.format(
-                service_name=kwargs.get('service_name', 'Subscription Service'),
-                start_date=kwargs.get('start_date', 'Today')
-            )
-        },
-        'bn': {
-            'welcome': WELCOME_MESSAGE_BN,
-            'activation': ACTIVATION_MESSAGE_BN,
-            'payment_confirmed': PAYMENT_CONFIRMED_BN,
-            'payment_approved': PAYMENT_APPROVED_BN,
-        }
-    }
-    
     if message_type == 'custom':
         return create_delivery_message(**kwargs)
     
-    return messages.get(language, messages['en']).get(
+    # Only format the professional template when it's actually requested (there is no Bengali version)
+    if message_type == 'professional' and language != 'bn':
+        return PROFESSIONAL_DELIVERY.format(
+            service_name=kwargs.get('service_name', 'Subscription Service'),
+            start_date=kwargs.get('start_date', 'Today')
+        )
+    
+    return _MESSAGES.get(language, _MESSAGES['en']).get(
         message_type, 
         WELCOME_MESSAGE
     )
@@ -3,6 +3,7 @@ Email-to-SMS Gateway Mappings
 Each carrier has a specific email domain format for sending SMS via email.
 Format: [10-digit-phone-number]@[gateway-domain]
 """
+import types
 
 EMAIL_SMS_GATEWAYS = {
     # Major US Carriers
@@ -79,6 +80,14 @@ EMAIL_SMS_GATEWAYS = {
     'ameritechclear': 'clearpath.acswireless.com',
 }
 
+# The mapping is static: expose it read-only and build the carrier name lists once
+EMAIL_SMS_GATEWAYS = types.MappingProxyType(EMAIL_SMS_GATEWAYS)
+_CARRIERS_JOINED = ', '.join(EMAIL_SMS_GATEWAYS)
+_CARRIER_LIST = tuple(EMAIL_SMS_GATEWAYS)
+
+# Deletes every Latin-1 non-digit in a single str.translate pass
+_DIGIT_TABLE = str.maketrans('', '', ''.join(chr(c) for c in range(256) if not chr(c).isdigit()))
+
 def get_sms_email(phone_number, carrier):
     """
     Generate SMS email address from phone number and carrier.
@@ -91,21 +100,23 @@ def get_sms_email(phone_number, carrier):
         Email address string (e.g., '1234567890@myboostmobile.com')
     """
     # Clean phone number (remove non-digits)
-    clean_phone = ''.join(filter(str.isdigit, phone_number))
+    clean_phone = phone_number.translate(_DIGIT_TABLE)
+    if clean_phone and not clean_phone.isdigit():
+        # Characters outside Latin-1 survive the table, drop them the slow way
+        clean_phone = ''.join(filter(str.isdigit, clean_phone))
     
     # Ensure it's 10 digits
     if len(clean_phone) != 10:
         raise ValueError(f"Phone number must be 10 digits, got {len(clean_phone)}")
     
     # Get carrier domain
-    carrier_lower = carrier.lower()
-    if carrier_lower not in EMAIL_SMS_GATEWAYS:
-        raise ValueError(f"Unknown carrier: {carrier}. Available carriers: {', '.join(EMAIL_SMS_GATEWAYS.keys())}")
+    gateway = EMAIL_SMS_GATEWAYS.get(carrier.lower())
+    if gateway is None:
+        raise ValueError(f"Unknown carrier: {carrier}. Available carriers: {_CARRIERS_JOINED}")
     
-    gateway = EMAIL_SMS_GATEWAYS[carrier_lower]
     return f"{clean_phone}@{gateway}"
 
 def list_available_carriers():
-    """Return list of available carrier names."""
-    return list(EMAIL_SMS_GATEWAYS.keys())
+    """Return the available carrier names (an immutable tuple, shared between calls)."""
+    return _CARRIER_LIST
 
@@ -8,9 +8,12 @@ from datetime import datetime, timedelta
 # Base URL for the API
 BASE_URL = "http://localhost:5000/api"
 
+# Shared session so the example calls reuse one keep-alive connection
+SESSION = requests.Session()
+
 def example_subscribe():
     """Example: Subscribe a new user"""
-    response = requests.post(f"{BASE_URL}/subscribe", json={
+    response = SESSION.post(f"{BASE_URL}/subscribe", json={
         "phone_number": "1234567890",
         "carrier": "boost",  # Use 'boost' for Boost Mobile
         "email": "user@example.com",
@@ -21,13 +24,13 @@ def example_subscribe():
 
 def example_get_carriers():
     """Example: Get list of available carriers"""
-    response = requests.get(f"{BASE_URL}/carriers")
+    response = SESSION.get(f"{BASE_URL}/carriers")
     print("Available Carriers:", response.json())
     return response.json()
 
 def example_send_sms(subscriber_id, message):
     """Example: Send immediate SMS to subscriber"""
-    response = requests.post(
+    response = SESSION.post(
         f"{BASE_URL}/subscribers/{subscriber_id}/send-sms",
         json={"message": message}
     )
@@ -38,7 +41,7 @@ def example_schedule_message(subscriber_id, message, hours_from_now=24):
     """Example: Schedule a message for later"""
     scheduled_time = (datetime.utcnow() + timedelta(hours=hours_from_now)).isoformat() + "Z"
     
-    response = requests.post(
+    response = SESSION.post(
         f"{BASE_URL}/subscribers/{subscriber_id}/schedule-message",
         json={
             "message": message,
@@ -50,7 +53,7 @@ def example_schedule_message(subscriber_id, message, hours_from_now=24):
 
 def example_get_subscribers():
     """Example: Get all subscribers"""
-    response = requests.get(f"{BASE_URL}/subscribers")
+    response = SESSION.get(f"{BASE_URL}/subscribers")
     print("Subscribers:", response.json())
     return response.json()
 
@@ -11,6 +11,9 @@ load_dotenv()
 
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
+# Shared session so both Telegram API calls reuse one HTTPS connection
+SESSION = requests.Session()
+
 if not TELEGRAM_BOT_TOKEN:
     print("[ERROR] TELEGRAM_BOT_TOKEN not found in .env")
     exit(1)
@@ -20,7 +23,7 @@ print(f"[INFO] Clearing webhook for bot...")
 try:
     # Delete webhook
     delete_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/deleteWebhook"
-    response = requests.get(delete_url, params={"drop_pending_updates": True}, timeout=10)
+    response = SESSION.get(delete_url, params={"drop_pending_updates": True}, timeout=10)
     
     if response.status_code == 200:
         print("[OK] Webhook deleted successfully!")
@@ -31,7 +34,7 @@ try:
         
     # Get bot info to verify
     get_me_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/getMe"
-    me_response = requests.get(get_me_url, timeout=10)
+    me_response = SESSION.get(get_me_url, timeout=10)
     
     if me_response.status_code == 200:
         bot_info = me_response.json()
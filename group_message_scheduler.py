@@ -3,10 +3,73 @@ Group Message Scheduler
 Schedules recurring messages (morning, noon, evening) for service groups
 with timezone matching support based on subscriber preferences
 """
-from datetime import datetime, timedelta, time
+from datetime import datetime, timedelta, time, timezone
 from models import db, Subscriber, ScheduledMessage, ServiceGroup
+from sqlalchemy import insert, select
+from sqlalchemy.orm import load_only
 from scheduler import schedule_message
-import json
+
+# Message types scheduled each day, in send order
+MESSAGE_TYPES = ('morning', 'noon', 'evening')
+
+# Default message per message type when no text is given
+_DEFAULT_GREETINGS = {
+    'morning': 'Good morning! 🌅',
+    'noon': 'Good noon! ☀️',
+    'evening': 'Good evening! 🌆',
+}
+
+# Subscribers fetched, and scheduled message rows inserted, per batch
+SCHEDULE_BATCH_SIZE = 1000
+
+# Subscriber columns needed to build a scheduled message
+_SCHEDULING_COLUMNS = (
+    Subscriber.id,
+    Subscriber.use_timezone_matching,
+    Subscriber.message_delivery_preference,
+    Subscriber.timezone_offset_minutes,
+    Subscriber.timezone_label,
+)
+
+def _get_send_time(group, message_type):
+    """Get the group's configured send time for a message type (defaults to 08:00)."""
+    time_str = group.scheduled_times_dict.get(message_type, '08:00')  # Default 8 AM
+    hour, minute = map(int, time_str.split(':'))
+    return time(hour, minute)
+
+def _scheduled_message_row(subscriber, base_time, message):
+    """
+    Build the scheduled_messages row for one subscriber.
+    
+    Args:
+        subscriber: Subscriber (or row) with the _SCHEDULING_COLUMNS attributes
+        base_time: Scheduled wall-clock time (naive datetime)
+        message: Message text
+    
+    Returns:
+        tuple: (row dict, True if the time was matched to the subscriber's timezone)
+    """
+    # Check if subscriber wants timezone matching
+    use_timezone = subscriber.use_timezone_matching and subscriber.message_delivery_preference == 'scheduled_timezone'
+    
+    if use_timezone:
+        # Calculate UTC time based on subscriber's timezone:
+        # convert the local time to UTC by subtracting the timezone offset
+        timezone_offset = subscriber.timezone_offset_minutes or 0
+        utc_time = base_time - timedelta(minutes=timezone_offset)
+    else:
+        # Use same UTC time for everyone (not timezone-matched)
+        # Schedule at the specified time in UTC
+        utc_time = base_time
+    
+    row = {
+        'subscriber_id': subscriber.id,
+        'message': message,
+        'scheduled_time': utc_time,
+        'timezone_offset_minutes': subscriber.timezone_offset_minutes or 0,
+        'timezone_label': subscriber.timezone_label or 'UTC'
+    }
+    return row, bool(use_timezone)
 
 def schedule_group_messages(group_id, message_type='morning', message_text=None, date=None):
     """
@@ -21,78 +84,120 @@ def schedule_group_messages(group_id, message_type='morning', message_text=None,
     Returns:
         dict with scheduling results
     """
-    with db.session.begin():
-        group = ServiceGroup.query.get(group_id)
-        if not group:
-            return {'error': 'Group not found', 'scheduled': 0}
-        
-        # Get scheduled times from group
-        scheduled_times = {}
-        if group.scheduled_times:
-            try:
-                scheduled_times = json.loads(group.scheduled_times)
-            except:
-                pass
-        
-        # Get time for this message type
-        time_str = scheduled_times.get(message_type, '08:00')  # Default 8 AM
-        hour, minute = map(int, time_str.split(':'))
-        
-        # Get all active subscribers in this group
-        subscribers = Subscriber.query.filter_by(
-            group_id=group_id,
-            subscription_status='active'
-        ).all()
-        
-        if date is None:
-            date = datetime.utcnow().date()
-        
-        scheduled_count = 0
-        timezone_matched_count = 0
-        non_timezone_matched_count = 0
-        
+    group = db.session.get(ServiceGroup, group_id)
+    if not group:
+        return {'error': 'Group not found', 'scheduled': 0}
+    
+    # Stream active subscribers in this group in batches (only the columns used below)
+    subscribers = Subscriber.query.filter_by(
+        group_id=group_id,
+        subscription_status='active'
+    ).options(load_only(*_SCHEDULING_COLUMNS)).yield_per(SCHEDULE_BATCH_SIZE)
+    
+    if date is None:
+        date = datetime.now(timezone.utc).date()
+    
+    scheduled_count = 0
+    timezone_matched_count = 0
+    
+    # Scheduled wall-clock time, the same base for every subscriber
+    base_time = datetime.combine(date, _get_send_time(group, message_type))
+    
+    # Use provided message or default (same for every subscriber)
+    final_message = message_text or _DEFAULT_GREETINGS.get(message_type) or f"Good {message_type}! 🌆"
+    
+    rows = []
+    try:
         for subscriber in subscribers:
-            # Use provided message or default
-            final_message = message_text or f"Good {message_type}! 🌅" if message_type == 'morning' else f"Good {message_type}! ☀️" if message_type == 'noon' else f"Good {message_type}! 🌆"
-            
-            # Check if subscriber wants timezone matching
-            use_timezone = subscriber.use_timezone_matching and subscriber.message_delivery_preference == 'scheduled_timezone'
-            
-            if use_timezone:
-                # Calculate UTC time based on subscriber's timezone
-                subscriber_local_time = datetime.combine(date, time(hour, minute))
-                # Convert to UTC by subtracting timezone offset
-                timezone_offset = subscriber.timezone_offset_minutes or 0
-                utc_time = subscriber_local_time - timedelta(minutes=timezone_offset)
-                timezone_matched_count += 1
-            else:
-                # Use same UTC time for everyone (not timezone-matched)
-                # Schedule at the specified time in UTC
-                utc_time = datetime.combine(date, time(hour, minute))
-                non_timezone_matched_count += 1
-            
-            # Create scheduled message
-            scheduled_msg = ScheduledMessage(
-                subscriber_id=subscriber.id,
-                message=final_message,
-                scheduled_time=utc_time,
-                timezone_offset_minutes=subscriber.timezone_offset_minutes or 0,
-                timezone_label=subscriber.timezone_label or 'UTC'
-            )
-            
-            db.session.add(scheduled_msg)
+            row, timezone_matched = _scheduled_message_row(subscriber, base_time, final_message)
+            rows.append(row)
             scheduled_count += 1
+            timezone_matched_count += timezone_matched
+            
+            # One executemany INSERT per batch instead of a unit-of-work entry per row
+            if len(rows) >= SCHEDULE_BATCH_SIZE:
+                db.session.execute(insert(ScheduledMessage), rows)
+                rows = []
+        
+        if rows:
+            db.session.execute(insert(ScheduledMessage), rows)
         
         db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return {
+        'success': True,
+        'scheduled': scheduled_count,
+        'timezone_matched': timezone_matched_count,
+        'non_timezone_matched': scheduled_count - timezone_matched_count,
+        'message_type': message_type,
+        'date': date.isoformat()
+    }
+
+def _schedule_group_days(group_id, dates):
+    """
+    Schedule all three daily messages for a group on each of the given dates.
+    Loads the group and its subscribers once and commits once, instead of once per message type and day.
+    
+    Args:
+        group_id: Service group ID
+        dates: List of dates to schedule
+    
+    Returns:
+        dict: {date.isoformat(): {message_type: result}}, or None if the group doesn't exist
+    """
+    group = db.session.get(ServiceGroup, group_id)
+    if not group:
+        return None
+    
+    send_times = {msg_type: _get_send_time(group, msg_type) for msg_type in MESSAGE_TYPES}
+    
+    # Every day and message type goes to the same subscribers, so read them once
+    subscribers = db.session.execute(
+        select(*_SCHEDULING_COLUMNS).where(
+            Subscriber.group_id == group_id,
+            Subscriber.subscription_status == 'active'
+        )
+    ).all()
+    
+    results = {}
+    rows = []
+    try:
+        for current_date in dates:
+            day_results = {}
+            for msg_type in MESSAGE_TYPES:
+                base_time = datetime.combine(current_date, send_times[msg_type])
+                timezone_matched_count = 0
+                for subscriber in subscribers:
+                    row, timezone_matched = _scheduled_message_row(subscriber, base_time, _DEFAULT_GREETINGS[msg_type])
+                    rows.append(row)
+                    timezone_matched_count += timezone_matched
+                    
+                    if len(rows) >= SCHEDULE_BATCH_SIZE:
+                        db.session.execute(insert(ScheduledMessage), rows)
+                        rows = []
+                
+                day_results[msg_type] = {
+                    'success': True,
+                    'scheduled': len(subscribers),
+                    'timezone_matched': timezone_matched_count,
+                    'non_timezone_matched': len(subscribers) - timezone_matched_count,
+                    'message_type': msg_type,
+                    'date': current_date.isoformat()
+                }
+            results[current_date.isoformat()] = day_results
         
-        return {
-            'success': True,
-            'scheduled': scheduled_count,
-            'timezone_matched': timezone_matched_count,
-            'non_timezone_matched': non_timezone_matched_count,
-            'message_type': message_type,
-            'date': date.isoformat()
-        }
+        if rows:
+            db.session.execute(insert(ScheduledMessage), rows)
+        
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return results
 
 def schedule_daily_group_messages(group_id, date=None):
     """
@@ -105,12 +210,14 @@ def schedule_daily_group_messages(group_id, date=None):
     Returns:
         dict with results for all three message types
     """
-    results = {}
+    if date is None:
+        date = datetime.now(timezone.utc).date()
     
-    for msg_type in ['morning', 'noon', 'evening']:
-        results[msg_type] = schedule_group_messages(group_id, msg_type, date=date)
+    results = _schedule_group_days(group_id, [date])
+    if results is None:
+        return {msg_type: {'error': 'Group not found', 'scheduled': 0} for msg_type in MESSAGE_TYPES}
     
-    return results
+    return results[date.isoformat()]
 
 def schedule_weekly_group_messages(group_id, start_date=None):
     """
@@ -124,14 +231,14 @@ def schedule_weekly_group_messages(group_id, start_date=None):
         dict with results for each day
     """
     if start_date is None:
-        start_date = datetime.utcnow().date()
-    
-    results = {}
+        start_date = datetime.now(timezone.utc).date()
     
-    for day_offset in range(7):
-        current_date = start_date + timedelta(days=day_offset)
-        day_results = schedule_daily_group_messages(group_id, date=current_date)
-        results[current_date.isoformat()] = day_results
+    dates = [start_date + timedelta(days=day_offset) for day_offset in range(7)]
+    results = _schedule_group_days(group_id, dates)
+    if results is None:
+        return {
+            current_date.isoformat(): {msg_type: {'error': 'Group not found', 'scheduled': 0} for msg_type in MESSAGE_TYPES}
+            for current_date in dates
+        }
     
     return results
-
@@ -23,7 +23,7 @@ def init_database():
         print("\n📋 Available Plans:")
         for plan in all_plans:
             trial_info = f" ({plan.trial_days} days trial)" if plan.has_trial else ""
-            print(f"  - {plan.name}: ${plan.price}/month{trial_info}")
+            print(f"  - {plan.name}: ${plan.price:.2f}/month{trial_info}")
 
 if __name__ == '__main__':
     init_database()
@@ -0,0 +1,79 @@
+"""
+JSON Encoding Helpers
+Fast JSON serialization for API responses using orjson (falls back to the stdlib json module)
+"""
+import json
+import uuid
+from decimal import Decimal
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, use stdlib json instead
+    orjson = None
+
+# Encoders for values orjson can't serialize natively, looked up by exact type
+_ENCODERS = {
+    Decimal: float,
+    uuid.UUID: str,
+    set: list,
+    frozenset: list,
+}
+
+# Base orjson options shared by every dump
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z) if orjson else 0
+
+def _default(obj):
+    """Encode a non-native value via the type dispatch table."""
+    encoder = _ENCODERS.get(type(obj))
+    if encoder is not None:
+        return encoder(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(obj):
+    """
+    Serialize an object to a JSON string.
+
+    Args:
+        obj: Object to serialize
+
+    Returns:
+        str: JSON document
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS).decode()
+    return json.dumps(obj, default=_default)
+
+def loads(data):
+    """
+    Parse a JSON document.
+
+    Args:
+        data: JSON document (bytes or str)
+
+    Returns:
+        Parsed object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes jsonify() responses and parses request bodies with orjson."""
+
+    def dumps(self, obj, **kwargs):
+        option = ORJSON_OPTIONS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        # orjson.JSONDecodeError subclasses ValueError, so request.get_json() still answers 400
+        return orjson.loads(s)
+
+def init_json_provider(app):
+    """Use orjson for the app's JSON responses and request bodies when it is installed."""
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
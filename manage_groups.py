@@ -3,8 +3,20 @@ Script to manage service groups
 Allows creating and managing multiple groups/services on the same website
 """
 from app import app
+from sqlalchemy.orm import joinedload
 from models import db, ServiceGroup, SubscriptionPlan
-import json
+from json_provider import dumps as json_dumps
+
+# update_group() keyword -> ServiceGroup attribute for fields copied as-is
+_UPDATE_FIELDS = {
+    'name': 'name',
+    'description': 'description',
+    'start_message': 'start_message',
+    'support_telegram': 'support_telegram_username',
+    'support_email': 'support_email',
+    'default_plan_id': 'default_plan_id',
+    'is_active': 'is_active',
+}
 
 def create_group(name, description, start_message, support_telegram=None, support_email=None, default_plan_id=None, scheduled_times=None):
     """Create a new service group."""
@@ -23,7 +35,7 @@ def create_group(name, description, start_message, support_telegram=None, suppor
             support_telegram_username=support_telegram,
             support_email=support_email,
             default_plan_id=default_plan_id,
-            scheduled_times=json.dumps(scheduled_times) if scheduled_times else None,
+            scheduled_times=json_dumps(scheduled_times) if scheduled_times else None,
             is_active=True
         )
         
@@ -36,30 +48,28 @@ def create_group(name, description, start_message, support_telegram=None, suppor
 def list_groups():
     """List all service groups."""
     with app.app_context():
-        groups = ServiceGroup.query.all()
+        # Load each group's default plan in the same query, so touching group.default_plan never adds a SELECT per group
+        groups = ServiceGroup.query.options(joinedload(ServiceGroup.default_plan)).all()
         if not groups:
             print("No groups found.")
             return
         
-        print("\n📋 Service Groups:")
-        print("-" * 60)
+        # Collect the whole listing and write it with a single print
+        lines = ["\n📋 Service Groups:", "-" * 60]
         for group in groups:
             status = "✅ Active" if group.is_active else "❌ Inactive"
-            print(f"\nID: {group.id}")
-            print(f"Name: {group.name}")
-            print(f"Status: {status}")
+            lines.append(f"\nID: {group.id}")
+            lines.append(f"Name: {group.name}")
+            lines.append(f"Status: {status}")
             if group.description:
-                print(f"Description: {group.description}")
+                lines.append(f"Description: {group.description}")
             if group.support_telegram_username:
-                print(f"Support Telegram: {group.support_telegram_username}")
+                lines.append(f"Support Telegram: {group.support_telegram_username}")
             if group.support_email:
-                print(f"Support Email: {group.support_email}")
-            if group.scheduled_times:
-                try:
-                    times = json.loads(group.scheduled_times)
-                    print(f"Scheduled Times: {times}")
-                except:
-                    pass
+                lines.append(f"Support Email: {group.support_email}")
+            if group.scheduled_times_dict:
+                lines.append(f"Scheduled Times: {group.scheduled_times_dict}")
+        print("\n".join(lines))
 
 def update_group(group_id, **kwargs):
     """Update a service group."""
@@ -70,22 +80,11 @@ def update_group(group_id, **kwargs):
             return None
         
         # Update fields
-        if 'name' in kwargs:
-            group.name = kwargs['name']
-        if 'description' in kwargs:
-            group.description = kwargs['description']
-        if 'start_message' in kwargs:
-            group.start_message = kwargs['start_message']
-        if 'support_telegram' in kwargs:
-            group.support_telegram_username = kwargs['support_telegram']
-        if 'support_email' in kwargs:
-            group.support_email = kwargs['support_email']
-        if 'default_plan_id' in kwargs:
-            group.default_plan_id = kwargs['default_plan_id']
+        for key, attr in _UPDATE_FIELDS.items():
+            if key in kwargs:
+                setattr(group, attr, kwargs[key])
         if 'scheduled_times' in kwargs:
-            group.scheduled_times = json.dumps(kwargs['scheduled_times']) if kwargs['scheduled_times'] else None
-        if 'is_active' in kwargs:
-            group.is_active = kwargs['is_active']
+            group.scheduled_times = json_dumps(kwargs['scheduled_times']) if kwargs['scheduled_times'] else None
         
         db.session.commit()
         print(f"✅ Updated group: {group.name} (ID: {group.id})")
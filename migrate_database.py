@@ -5,6 +5,7 @@ Adds new columns to subscribers table and creates new tables for plans and disco
 from app import app
 from models import db, SubscriptionPlan, DiscountCode, ServiceGroup
 from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import CITEXT
 
 def migrate_database():
     """Migrate database to add new columns and tables."""
@@ -31,42 +32,40 @@ def migrate_database():
             'group_id': 'INTEGER'
         }
         
+        # ALTER TABLE statements to run, as (table, column, sql). Columns are checked against the
+        # inspector first, so every statement adds a missing column and all of them run in one transaction
+        alter_statements = []
+        
         # Add missing columns to subscribers table
         columns_to_add = {k: v for k, v in new_columns.items() if k not in existing_columns}
         
         if columns_to_add:
             print(f"\n📝 Adding {len(columns_to_add)} new columns to subscribers table...")
             for col_name, col_type in columns_to_add.items():
-                try:
-                    if col_type.startswith('NUMERIC'):
-                        # SQLite doesn't support NUMERIC directly, use REAL
-                        sql_type = 'REAL'
-                    elif col_type.startswith('BOOLEAN'):
-                        sql_type = 'INTEGER DEFAULT 0'
-                    elif col_type.startswith('DATETIME'):
-                        sql_type = 'DATETIME'
-                    elif col_type.startswith('TEXT'):
-                        sql_type = 'TEXT'
-                    elif col_type.startswith('INTEGER'):
-                        sql_type = 'INTEGER'
-                    else:
-                        sql_type = col_type
-                    
-                    # SQLite doesn't support ALTER TABLE ADD COLUMN with constraints easily
-                    # So we'll use a simpler approach
-                    if 'DEFAULT' in sql_type:
-                        default_value = sql_type.split('DEFAULT')[1].strip()
-                        sql_type = sql_type.split('DEFAULT')[0].strip()
-                        alter_sql = f"ALTER TABLE subscribers ADD COLUMN {col_name} {sql_type} DEFAULT {default_value}"
-                    else:
-                        alter_sql = f"ALTER TABLE subscribers ADD COLUMN {col_name} {sql_type}"
-                    
-                    db.session.execute(text(alter_sql))
-                    print(f"  ✅ Added column: {col_name}")
-                except Exception as e:
-                    print(f"  ⚠️  Column {col_name} might already exist: {e}")
-            
-            db.session.commit()
+                if col_type.startswith('NUMERIC'):
+                    # SQLite doesn't support NUMERIC directly, use REAL
+                    sql_type = 'REAL'
+                elif col_type.startswith('BOOLEAN'):
+                    sql_type = 'INTEGER DEFAULT 0'
+                elif col_type.startswith('DATETIME'):
+                    sql_type = 'DATETIME'
+                elif col_type.startswith('TEXT'):
+                    sql_type = 'TEXT'
+                elif col_type.startswith('INTEGER'):
+                    sql_type = 'INTEGER'
+                else:
+                    sql_type = col_type
+                
+                # SQLite doesn't support ALTER TABLE ADD COLUMN with constraints easily
+                # So we'll use a simpler approach
+                if 'DEFAULT' in sql_type:
+                    default_value = sql_type.split('DEFAULT')[1].strip()
+                    sql_type = sql_type.split('DEFAULT')[0].strip()
+                    alter_sql = f"ALTER TABLE subscribers ADD COLUMN {col_name} {sql_type} DEFAULT {default_value}"
+                else:
+                    alter_sql = f"ALTER TABLE subscribers ADD COLUMN {col_name} {sql_type}"
+                
+                alter_statements.append(('subscribers', col_name, alter_sql))
         else:
             print("✅ All columns already exist in subscribers table")
         
@@ -80,68 +79,122 @@ def migrate_database():
         if scheduled_to_add:
             print(f"\n📝 Adding {len(scheduled_to_add)} new columns to scheduled_messages table...")
             for col_name, col_type in scheduled_to_add.items():
-                try:
-                    if col_type.startswith('INTEGER'):
-                        sql_type = 'INTEGER'
-                    elif col_type.startswith('TEXT'):
-                        sql_type = 'TEXT'
-                    else:
-                        sql_type = col_type
-                    
-                    if 'DEFAULT' in col_type:
-                        default_value = col_type.split('DEFAULT')[1].strip()
-                        sql_type = sql_type.split('DEFAULT')[0].strip()
-                        alter_sql = f"ALTER TABLE scheduled_messages ADD COLUMN {col_name} {sql_type} DEFAULT {default_value}"
-                    else:
-                        alter_sql = f"ALTER TABLE scheduled_messages ADD COLUMN {col_name} {sql_type}"
-                    
-                    db.session.execute(text(alter_sql))
-                    print(f"  ✅ Added column: {col_name}")
-                except Exception as e:
-                    print(f"  ⚠️  Column {col_name} might already exist: {e}")
-            db.session.commit()
+                if col_type.startswith('INTEGER'):
+                    sql_type = 'INTEGER'
+                elif col_type.startswith('TEXT'):
+                    sql_type = 'TEXT'
+                else:
+                    sql_type = col_type
+                
+                if 'DEFAULT' in col_type:
+                    default_value = col_type.split('DEFAULT')[1].strip()
+                    sql_type = sql_type.split('DEFAULT')[0].strip()
+                    alter_sql = f"ALTER TABLE scheduled_messages ADD COLUMN {col_name} {sql_type} DEFAULT {default_value}"
+                else:
+                    alter_sql = f"ALTER TABLE scheduled_messages ADD COLUMN {col_name} {sql_type}"
+                
+                alter_statements.append(('scheduled_messages', col_name, alter_sql))
         else:
             print("✅ All columns already exist in scheduled_messages table")
         
-        # Create new tables if they don't exist
+        # Run every ALTER in a single transaction with one commit, instead of a commit per table
+        if alter_statements:
+            try:
+                for table_name, col_name, alter_sql in alter_statements:
+                    db.session.execute(text(alter_sql))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"  ❌ Could not add column {table_name}.{col_name}: {e}")
+                raise
+            for table_name, col_name, alter_sql in alter_statements:
+                print(f"  ✅ Added column: {table_name}.{col_name}")
+        
+        # Index subscribers.plan_id so the plan-in-use check is an index lookup
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_subscribers_plan_id ON subscribers (plan_id)"))
+        db.session.commit()
+        print("✅ Index on subscribers.plan_id is in place")
+        
+        # Index the subscriber lookups by Telegram user, group + status and Stripe subscription
+        subscriber_indexes = {
+            'ix_subscribers_telegram_user_id': 'telegram_user_id',
+            'ix_subscribers_group_status': 'group_id, subscription_status',
+            'ix_subscribers_stripe_subscription_id': 'stripe_subscription_id',
+        }
+        for index_name, index_columns in subscriber_indexes.items():
+            db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON subscribers ({index_columns})"))
+        db.session.commit()
+        print("✅ Subscriber lookup indexes are in place")
+        
+        # Create new tables if they don't exist (create_all skips existing tables, so one call covers them all)
         existing_tables = inspector.get_table_names()
+        new_tables = ('subscription_plans', 'discount_codes', 'service_groups')
+        missing_tables = [name for name in new_tables if name not in existing_tables]
         
-        if 'subscription_plans' not in existing_tables:
-            print("\n📝 Creating subscription_plans table...")
+        if missing_tables:
+            print(f"\n📝 Creating {', '.join(missing_tables)} table(s)...")
             db.create_all()
-            print("  ✅ Created subscription_plans table")
-        else:
-            print("✅ subscription_plans table already exists")
         
-        if 'discount_codes' not in existing_tables:
-            print("\n📝 Creating discount_codes table...")
-            db.create_all()
-            print("  ✅ Created discount_codes table")
-        else:
-            print("✅ discount_codes table already exists")
+        for table_name in new_tables:
+            if table_name in missing_tables:
+                print(f"  ✅ Created {table_name} table")
+            else:
+                print(f"✅ {table_name} table already exists")
         
-        if 'service_groups' not in existing_tables:
-            print("\n📝 Creating service_groups table...")
-            db.create_all()
-            print("  ✅ Created service_groups table")
-        else:
-            print("✅ service_groups table already exists")
+        # Ensure discount_codes has the cached_repr column (serialized to_dict() payload)
+        discount_columns = [col['name'] for col in db.inspect(db.engine).get_columns('discount_codes')]
+        if 'cached_repr' not in discount_columns:
+            print("\n📝 Adding cached_repr column to discount_codes table...")
+            json_type = 'JSONB' if db.engine.dialect.name == 'postgresql' else 'JSON'
+            db.session.execute(text(f"ALTER TABLE discount_codes ADD COLUMN cached_repr {json_type}"))
+            db.session.commit()
+            print("  ✅ Added column: cached_repr")
+        
+        # Backfill cached_repr for codes written before the column existed
+        stale_codes = DiscountCode.query.filter(DiscountCode.cached_repr.is_(None)).all()
+        for code in stale_codes:
+            db.session.execute(code.cached_repr_update())
+        db.session.commit()
+        if stale_codes:
+            print(f"  ✅ Cached {len(stale_codes)} discount code(s)")
+        
+        # Make discount_codes.code case-insensitive on Postgres
+        if db.engine.dialect.name == 'postgresql':
+            code_column = next(col for col in db.inspect(db.engine).get_columns('discount_codes') if col['name'] == 'code')
+            if not isinstance(code_column['type'], CITEXT):
+                print("\n📝 Converting discount_codes.code to CITEXT...")
+                db.session.execute(text("CREATE EXTENSION IF NOT EXISTS citext"))
+                db.session.execute(text("ALTER TABLE discount_codes ALTER COLUMN code TYPE CITEXT"))
+                db.session.commit()
+                print("  ✅ discount_codes.code is now CITEXT")
+        
+        # Index subscriptions for the per-subscriber, per-method record lookup
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_subscriptions_subscriber_method ON subscriptions (subscriber_id, payment_method)"))
+        db.session.commit()
+        print("✅ Index on subscriptions (subscriber_id, payment_method) is in place")
+        
+        # Index discount_codes for keyset pagination of the admin code list
+        db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_discount_codes_created_at_id ON discount_codes (created_at DESC, id DESC)"))
+        db.session.commit()
+        print("✅ Index on discount_codes (created_at, id) is in place")
         
-        # Create default plans if none exist
-        if SubscriptionPlan.query.count() == 0:
+        # Create default plans if none exist (count once, reused for the summary)
+        plan_count = SubscriptionPlan.query.count()
+        if plan_count == 0:
             print("\n📝 Creating default subscription plans...")
             from plan_manager import create_default_plans
             plans = create_default_plans()
-            print(f"  ✅ Created {len(plans)} default plans")
+            plan_count = len(plans)
+            print(f"  ✅ Created {plan_count} default plans")
         else:
-            print(f"✅ {SubscriptionPlan.query.count()} plans already exist")
+            print(f"✅ {plan_count} plans already exist")
         
         print("\n✅ Database migration completed successfully!")
         
         # Show summary
         print("\n📊 Database Summary:")
         print(f"  - Subscribers: {db.session.execute(text('SELECT COUNT(*) FROM subscribers')).scalar()}")
-        print(f"  - Plans: {SubscriptionPlan.query.count()}")
+        print(f"  - Plans: {plan_count}")
         print(f"  - Discount Codes: {DiscountCode.query.count()}")
         print(f"  - Service Groups: {ServiceGroup.query.count()}")
 
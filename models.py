@@ -1,6 +1,10 @@
 from datetime import datetime, timedelta
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import CITEXT, JSONB
+from sqlalchemy.orm.attributes import set_committed_value
 from decimal import Decimal
+from json_provider import loads as json_loads
 
 db = SQLAlchemy()
 
@@ -34,7 +38,7 @@ class Subscriber(db.Model):
     group_id = db.Column(db.Integer, db.ForeignKey('service_groups.id'), nullable=True)
     
     # Subscription info
-    plan_id = db.Column(db.Integer, db.ForeignKey('subscription_plans.id'))
+    plan_id = db.Column(db.Integer, db.ForeignKey('subscription_plans.id', ondelete='RESTRICT'), index=True)
     payment_method = db.Column(db.String(50), default='stripe')  # stripe, paypal, crypto
     stripe_customer_id = db.Column(db.String(255))
     stripe_subscription_id = db.Column(db.String(255))
@@ -46,8 +50,8 @@ class Subscriber(db.Model):
     
     # Discount and trial info
     discount_code_id = db.Column(db.Integer, db.ForeignKey('discount_codes.id'))
-    applied_discount_percent = db.Column(db.Numeric(5, 2))  # Percentage discount applied
-    final_price = db.Column(db.Numeric(10, 2))  # Final price after discount
+    applied_discount_percent = db.Column(db.Numeric(5, 2, asdecimal=False))  # Percentage discount applied
+    final_price = db.Column(db.Numeric(10, 2, asdecimal=False))  # Final price after discount
     is_trial = db.Column(db.Boolean, default=False)
     trial_start_date = db.Column(db.DateTime)
     trial_end_date = db.Column(db.DateTime)
@@ -58,10 +62,18 @@ class Subscriber(db.Model):
     
     # Relationships
     messages = db.relationship('ScheduledMessage', backref='subscriber', lazy=True, cascade='all, delete-orphan')
-    plan = db.relationship('SubscriptionPlan', backref='subscribers', lazy=True)
+    # passive_deletes='all' leaves plan_id alone on plan delete so the RESTRICT FK decides
+    plan = db.relationship('SubscriptionPlan', backref=db.backref('subscribers', passive_deletes='all'), lazy=True)
     discount_code = db.relationship('DiscountCode', backref='subscribers', lazy=True)
     group = db.relationship('ServiceGroup', backref='subscribers', lazy=True)
     
+    # Lookup indexes for the bot's Telegram user lookup, group message scheduling and Stripe webhooks
+    __table_args__ = (
+        db.Index('ix_subscribers_telegram_user_id', 'telegram_user_id'),
+        db.Index('ix_subscribers_group_status', 'group_id', 'subscription_status'),
+        db.Index('ix_subscribers_stripe_subscription_id', 'stripe_subscription_id'),
+    )
+    
     def __repr__(self):
         return f'<Subscriber {self.phone_number}>'
     
@@ -129,6 +141,11 @@ class Subscription(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Lookup index for the per-subscriber, per-method record updated on payment activation
+    __table_args__ = (
+        db.Index('ix_subscriptions_subscriber_method', 'subscriber_id', 'payment_method'),
+    )
+    
     def __repr__(self):
         payment_id = self.stripe_subscription_id or self.paypal_subscription_id or self.crypto_payment_id
         return f'<Subscription {payment_id}>'
@@ -142,7 +159,7 @@ class DepositApproval(db.Model):
     
     # Payment details
     currency = db.Column(db.String(10), nullable=False)  # BTC, ETH, USDC, USDT
-    amount = db.Column(db.Numeric(10, 2), nullable=False)
+    amount = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)
     wallet_address = db.Column(db.String(255), nullable=False)
     transaction_hash = db.Column(db.String(255))
     
@@ -186,7 +203,7 @@ class SubscriptionPlan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)  # e.g., "Basic", "Premium", "Pro"
     description = db.Column(db.Text)
-    price = db.Column(db.Numeric(10, 2), nullable=False)  # Monthly price in USD
+    price = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)  # Monthly price in USD
     currency = db.Column(db.String(10), default='USD')
     
     # Trial settings
@@ -202,7 +219,8 @@ class SubscriptionPlan(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def __repr__(self):
-        return f'<SubscriptionPlan {self.name} - ${self.price}>'
+        price = f'{self.price:.2f}' if self.price is not None else self.price
+        return f'<SubscriptionPlan {self.name} - ${price}>'
     
     def to_dict(self):
         return {
@@ -232,12 +250,13 @@ class DiscountCode(db.Model):
     __tablename__ = 'discount_codes'
     
     id = db.Column(db.Integer, primary_key=True)
-    code = db.Column(db.String(50), nullable=False, unique=True)  # Promo code (e.g., "SAVE50", "FREETRIAL")
+    # Promo code (e.g., "SAVE50", "FREETRIAL"); case-insensitive CITEXT on Postgres
+    code = db.Column(db.String(50).with_variant(CITEXT(), 'postgresql'), nullable=False, unique=True)
     description = db.Column(db.Text)
     
     # Discount type
     discount_type = db.Column(db.String(20), default='percent')  # 'percent' or 'fixed'
-    discount_value = db.Column(db.Numeric(10, 2), nullable=False)  # Percentage (0-100) or fixed amount
+    discount_value = db.Column(db.Numeric(10, 2, asdecimal=False), nullable=False)  # Percentage (0-100) or fixed amount
     
     # Usage limits
     max_uses = db.Column(db.Integer, default=None)  # None = unlimited
@@ -253,12 +272,21 @@ class DiscountCode(db.Model):
     # Plan restrictions (optional - None means applies to all plans)
     applicable_plan_ids = db.Column(db.String(255))  # Comma-separated plan IDs, None = all plans
     
+    # to_dict() output stored on every write so list endpoints can skip ORM hydration
+    cached_repr = db.Column(db.JSON().with_variant(JSONB, 'postgresql'))
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Keyset pagination index for the admin code list (newest first)
+    __table_args__ = (
+        db.Index('ix_discount_codes_created_at_id', created_at.desc(), id.desc()),
+    )
+    
     def __repr__(self):
-        return f'<DiscountCode {self.code} - {self.discount_value}%>'
+        discount_value = f'{self.discount_value:.2f}' if self.discount_value is not None else self.discount_value
+        return f'<DiscountCode {self.code} - {discount_value}%>'
     
     def to_dict(self):
         return {
@@ -277,6 +305,13 @@ class DiscountCode(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
     
+    def cached_repr_update(self):
+        """Build the UPDATE that stores to_dict() in cached_repr (leaves updated_at unchanged)."""
+        data = self.to_dict()
+        set_committed_value(self, 'cached_repr', data)
+        table = DiscountCode.__table__
+        return table.update().where(table.c.id == self.id).values(cached_repr=data, updated_at=self.updated_at)
+    
     def is_valid(self, plan_id=None):
         """Check if discount code is valid."""
         if not self.is_active:
@@ -312,6 +347,19 @@ class DiscountCode(db.Model):
         
         return round(final_price, 2), round(discount_amount, 2)
 
+@event.listens_for(DiscountCode, 'after_insert')
+@event.listens_for(DiscountCode, 'after_update')
+def _store_discount_code_repr(mapper, connection, target):
+    """Keep cached_repr in sync with ORM inserts/updates of a discount code."""
+    connection.execute(target.cached_repr_update())
+
+# CITEXT needs its extension before discount_codes can be created
+event.listen(
+    DiscountCode.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS citext').execute_if(dialect='postgresql')
+)
+
 class ServiceGroup(db.Model):
     """Service groups for managing multiple groups/services on the same website"""
     __tablename__ = 'service_groups'
@@ -345,15 +393,24 @@ class ServiceGroup(db.Model):
     def __repr__(self):
         return f'<ServiceGroup {self.name}>'
     
-    def to_dict(self):
-        import json
+    @property
+    def scheduled_times_dict(self):
+        """Parsed scheduled_times, cached on the instance until the JSON string changes (treat as read-only)."""
+        cached = self.__dict__.get('_scheduled_times_cache')
+        if cached is not None and cached[0] == self.scheduled_times:
+            return cached[1]
+        
         scheduled_times = {}
         if self.scheduled_times:
             try:
-                scheduled_times = json.loads(self.scheduled_times)
+                scheduled_times = json_loads(self.scheduled_times)
             except:
                 scheduled_times = {}
         
+        self._scheduled_times_cache = (self.scheduled_times, scheduled_times)
+        return scheduled_times
+    
+    def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
@@ -363,7 +420,7 @@ class ServiceGroup(db.Model):
             'support_email': self.support_email,
             'is_active': self.is_active,
             'default_plan_id': self.default_plan_id,
-            'scheduled_times': scheduled_times,
+            'scheduled_times': dict(self.scheduled_times_dict),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
         }
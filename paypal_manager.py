@@ -186,19 +186,31 @@ def cancel_paypal_subscription(subscriber):
     if not subscriber.paypal_subscription_id:
         return False
     
-    billing_agreement = paypalrestsdk.BillingAgreement.find(subscriber.paypal_subscription_id)
+    if cancel_paypal_agreement(subscriber.paypal_subscription_id):
+        subscriber.subscription_status = 'canceled'
+        db.session.commit()
+        return True
+    else:
+        return False
+
+def cancel_paypal_agreement(agreement_id):
+    """
+    Cancel a PayPal billing agreement (PayPal API only, no database access).
+    
+    Args:
+        agreement_id: PayPal billing agreement ID
+    
+    Returns:
+        bool: True if canceled successfully
+    """
+    billing_agreement = paypalrestsdk.BillingAgreement.find(agreement_id)
     
     # Cancel the agreement
     cancel_note = {
         "note": "Subscription canceled by user"
     }
     
-    if billing_agreement.cancel(cancel_note):
-        subscriber.subscription_status = 'canceled'
-        db.session.commit()
-        return True
-    else:
-        return False
+    return bool(billing_agreement.cancel(cancel_note))
 
 def handle_paypal_webhook(event_type, resource):
     """
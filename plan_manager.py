@@ -2,8 +2,17 @@
 Plan and Discount Code Management Utilities
 """
 from datetime import datetime, timedelta
+import threading
+import time
+from sqlalchemy import insert
 from models import db, SubscriptionPlan, DiscountCode
 
+# Short-lived cache of discount code validation results, keyed by (code, plan_id)
+CODE_VALIDATION_CACHE_TTL = 30  # seconds
+CODE_VALIDATION_CACHE_MAX_SIZE = 4096
+_code_validation_cache = {}
+_code_validation_lock = threading.Lock()
+
 def get_active_plans():
     """Get all active subscription plans ordered by display_order."""
     return SubscriptionPlan.query.filter_by(is_active=True).order_by(SubscriptionPlan.display_order).all()
@@ -20,44 +29,44 @@ def create_default_plans():
     """Create default subscription plans if none exist."""
     if SubscriptionPlan.query.count() == 0:
         default_plans = [
-            SubscriptionPlan(
-                name="Basic",
-                description="Basic subscription plan",
-                price=1.60,
-                currency="USD",
-                has_trial=False,
-                trial_days=0,
-                is_active=True,
-                display_order=1
-            ),
-            SubscriptionPlan(
-                name="Premium",
-                description="Premium subscription plan",
-                price=2.99,
-                currency="USD",
-                has_trial=True,
-                trial_days=7,
-                is_active=True,
-                display_order=2
-            ),
-            SubscriptionPlan(
-                name="Pro",
-                description="Professional subscription plan",
-                price=4.99,
-                currency="USD",
-                has_trial=True,
-                trial_days=14,
-                is_active=True,
-                display_order=3
-            ),
+            {
+                'name': "Basic",
+                'description': "Basic subscription plan",
+                'price': 1.60,
+                'currency': "USD",
+                'has_trial': False,
+                'trial_days': 0,
+                'is_active': True,
+                'display_order': 1
+            },
+            {
+                'name': "Premium",
+                'description': "Premium subscription plan",
+                'price': 2.99,
+                'currency': "USD",
+                'has_trial': True,
+                'trial_days': 7,
+                'is_active': True,
+                'display_order': 2
+            },
+            {
+                'name': "Pro",
+                'description': "Professional subscription plan",
+                'price': 4.99,
+                'currency': "USD",
+                'has_trial': True,
+                'trial_days': 14,
+                'is_active': True,
+                'display_order': 3
+            },
         ]
         
-        for plan in default_plans:
-            db.session.add(plan)
+        # One batched INSERT ... RETURNING for all plans instead of a unit-of-work entry per plan
+        plans = db.session.scalars(insert(SubscriptionPlan).returning(SubscriptionPlan), default_plans).all()
         
         db.session.commit()
         print("✅ Default subscription plans created!")
-        return default_plans
+        return plans
     return []
 
 def validate_discount_code(code, plan_id=None):
@@ -119,6 +128,32 @@ def increment_discount_code_usage(discount_code):
     """Increment the usage count of a discount code."""
     discount_code.current_uses += 1
     db.session.commit()
+    clear_code_validation_cache()
+
+def get_cached_code_validation(code, plan_id=None):
+    """Get a cached validation result, or None if missing or expired (code must already be uppercased)."""
+    key = (code, plan_id)
+    with _code_validation_lock:
+        entry = _code_validation_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del _code_validation_cache[key]
+            return None
+        return result
+
+def cache_code_validation(code, plan_id, result):
+    """Cache a validation result for CODE_VALIDATION_CACHE_TTL seconds."""
+    with _code_validation_lock:
+        if len(_code_validation_cache) >= CODE_VALIDATION_CACHE_MAX_SIZE:
+            _code_validation_cache.clear()
+        _code_validation_cache[(code, plan_id)] = (time.monotonic() + CODE_VALIDATION_CACHE_TTL, result)
+
+def clear_code_validation_cache():
+    """Drop all cached validation results (call after discount codes change)."""
+    with _code_validation_lock:
+        _code_validation_cache.clear()
 
 def get_default_plan():
     """Get the default plan (lowest display_order active plan)."""
@@ -135,16 +135,28 @@ def cancel_subscription(subscriber):
     if not subscriber.stripe_subscription_id:
         return None
     
-    subscription = stripe.Subscription.modify(
-        subscriber.stripe_subscription_id,
-        cancel_at_period_end=True
-    )
+    subscription = cancel_stripe_subscription_id(subscriber.stripe_subscription_id)
     
     subscriber.subscription_status = 'canceled'
     db.session.commit()
     
     return subscription
 
+def cancel_stripe_subscription_id(subscription_id):
+    """
+    Cancel a Stripe subscription at period end (Stripe API only, no database access).
+    
+    Args:
+        subscription_id: Stripe subscription ID
+    
+    Returns:
+        stripe.Subscription object (canceled)
+    """
+    return stripe.Subscription.modify(
+        subscription_id,
+        cancel_at_period_end=True
+    )
+
 def handle_stripe_webhook(event):
     """
     Handle Stripe webhook events.
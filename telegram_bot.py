@@ -19,6 +19,7 @@ from crypto_manager import create_crypto_checkout, create_manual_crypto_subscrip
 from sms_sender import send_sms_to_subscriber
 from scheduler import schedule_message
 from datetime import datetime
+from functools import lru_cache
 import logging
 import asyncio
 import stripe
@@ -571,7 +572,7 @@ async def plan_selection_callback(update: Update, context: ContextTypes.DEFAULT_
 async def discount_code_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Handle discount code input."""
     user = update.effective_user
-    code_text = update.message.text.strip().upper()
+    code_text = update.message.text.strip()
     
     from app import app
     with app.app_context():
@@ -1167,7 +1168,7 @@ async def verify_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         hash_escaped = escape_markdown(transaction_hash)
         phone_escaped = escape_markdown(subscriber.phone_number)
         currency_escaped = escape_markdown(deposit_approval.currency)
-        amount_escaped = escape_markdown(str(deposit_approval.amount))
+        amount_escaped = escape_markdown(f"{deposit_approval.amount:.2f}")
         
         message = (
             f"✅ **Payment Verification Submitted!**\n\n"
@@ -1186,7 +1187,7 @@ async def verify_payment(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 f"✅ Payment Verification Submitted!\n\n"
                 f"Phone: {subscriber.phone_number}\n"
                 f"Currency: {deposit_approval.currency}\n"
-                f"Amount: ${deposit_approval.amount}\n"
+                f"Amount: ${deposit_approval.amount:.2f}\n"
                 f"Transaction Hash: {transaction_hash}\n\n"
                 f"⏳ Your payment is now pending admin approval.\n"
                 f"You will receive a confirmation message once approved."
@@ -1464,7 +1465,9 @@ def get_timezone_keyboard():
         keyboard.append(row)
     return InlineKeyboardMarkup(keyboard)
 
+@lru_cache(maxsize=128)
 def format_timezone_display(label, offset_minutes):
+    """Return human-friendly timezone text (cached: labels and offsets come from a small set)."""
     if offset_minutes is None:
         offset_minutes = 0
     sign = '+' if offset_minutes >= 0 else '-'